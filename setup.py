@@ -21,7 +21,9 @@ setup_data = {
     "url": "https://github.com/vbvr/sg_tools",
     "license": "BSD",
     "package_dir": {"": "src"},
-    "scripts": [SCRIPTDIR + "edsend", SCRIPTDIR + "sg-header"]
+    "scripts": [SCRIPTDIR + "edsend", SCRIPTDIR + "sg-header"],
+    "console_scripts": ["sg-tools = sg_tools.cli:main", "edsend = sg_tools.cli:send",
+                        "sg-header = sg_tools.cli:header"]
         }
 
 
@@ -85,7 +87,7 @@ if sys.version[0] >= '3' or (sys.version[0] == '2' and sys.version[2] >= '6'):
         ],
         package_dir=setup_data["package_dir"],
         packages=setuptools.find_packages(where="src"),
-        scripts=setup_data["scripts"],
+        entry_points={"console_scripts": setup_data["console_scripts"]},
         python_requires=">=2.3",
         install_requires=[
             "pyserial ==2.7; python_version<'2.7'",
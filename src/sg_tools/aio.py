@@ -0,0 +1,225 @@
+#!/usr/bin/python
+"""
+asyncio interface to the Everdrive loader.
+
+AsyncLink and AsyncLoader expose connecting, transferring and running an image as awaitables, so
+one event loop can drive transfers, progress reporting and other work at once. Every read and
+write of a link runs on a dedicated single thread I/O executor, so the event loop never blocks
+and serial operations stay in order.
+
+Each step takes an optional timeout. A step that times out or is cancelled part way closes the
+link, since the Everdrive is left in the middle of a command. The next connect opens it again.
+
+Requires Python 3.7+.
+"""
+
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from struct import pack
+
+from sg_tools.edsend import BLOCK, CHUNK, Image, Link, Meter, Parser, discover, remember
+
+
+class AsyncLink:
+    """
+    Communication interface to Everdrive, for asyncio.
+
+    Attributes:
+        link -- object
+    Link carrying out the reads and writes.
+        executor -- object
+    Single thread executor the reads and writes of the link run on.
+    """
+
+    def __init__(self, port, baud=9600, timeout=1, link=None):
+        self.link = link or Link(port, baud, timeout)
+        self.executor = ThreadPoolExecutor(1, "sg_tools-io")
+
+    async def call(self, function, *args):
+        """Run a blocking function on the I/O executor and return its result."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def step(self, steps, timeout):
+        """
+        Await the steps of a command within the timeout given, or the whole command.
+
+        The link is closed if the command is cancelled or times out part way.
+        """
+        try:
+            return await asyncio.wait_for(steps, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self.executor.submit(self.close)
+            raise
+
+    async def setup(self, timeout=None):
+        """Open the serial connection. Returns 1 if it could not be opened."""
+        return await self.step(self.call(self.link.setup), timeout)
+
+    async def test(self, timeout=None):
+        """Send init string and check for expected response."""
+        return await self.step(self.call(self.link.test), timeout)
+
+    async def transfer(self, image, chunk=CHUNK, progress=None, timeout=None):
+        """
+        Send an image to the Everdrive.
+
+        Keywords:
+            image -- Image object, or buffer
+            chunk -- integer, a multiple of the block size
+            progress -- function or coroutine function, or None. See Link.transfer.
+            timeout -- seconds for the whole transfer, or None
+        Chunks are written one at a time on the I/O executor, so the transfer can be cancelled
+        between any two of them.
+        """
+        if chunk <= 0 or chunk % BLOCK:
+            raise ValueError("Chunk size must be a multiple of %d bytes" % BLOCK)
+        if not isinstance(image, Image):
+            image = Image(image)
+        return await self.step(self.stream(image, chunk, progress), timeout)
+
+    async def stream(self, image, chunk, progress):
+        """Carry out the steps of a transfer."""
+        link = self.link
+        error = await self.call(link.post, str.encode(link.message["LD"]) +
+                                pack("B", image.blocks()), 0)
+        error = await self.call(link.response, link.message["OK"], error)
+        meter = Meter(len(image))
+        for piece in image.chunks(chunk):
+            error = await self.call(link.post, piece, error, False)
+            if error:
+                break
+            counts = meter.update(len(piece))
+            if progress is not None:
+                called = progress(*counts)
+                if inspect.isawaitable(called):
+                    await called
+        if not error:
+            await self.call(link.drain)
+        return await self.call(link.response, link.message["DOK"], error,
+                               link.deadline(len(image), meter.rate()))
+
+    async def run(self, mode, timeout=None):
+        """Post run mode."""
+        return await self.step(self.call(self.link.run, mode), timeout)
+
+    def close(self):
+        """Close the serial connection, if open."""
+        if self.link.cxn is not None:
+            self.link.cxn.close()
+            self.link.cxn = None
+
+    async def shutdown(self):
+        """Close the serial connection and stop the I/O executor."""
+        await self.call(self.close)
+        self.executor.shutdown(False)
+
+
+class AsyncLoader:
+    """
+    Everdrive loader, for asyncio.
+
+    Follows the steps of Loader: locate the Everdrive if no port is given, connect, load and
+    identify the image, send it, and run it. Every step is awaitable, takes an optional timeout,
+    and returns the error of the step, also kept in the error attribute.
+
+    Attributes:
+        link -- object
+    AsyncLink to the Everdrive, once connected.
+        file -- string
+    Filepath of image to load
+        parser -- object
+    File parser
+        serial_port -- string
+    Path to Everdrive connection. If not supplied, a scan is done on connect.
+        cxn -- tuple
+    Baud rate and read timeout of the connection.
+        run_mode -- string
+    Mode for launching the image file. Default is Mega Drive/Genesis
+        chunk -- integer
+    Size of each write of the image transfer, a multiple of the block size.
+        progress -- function
+    Called or awaited after each chunk of the image transfer, or None. See Link.transfer.
+        wait -- number
+    Seconds to wait for the Everdrive to be plugged in when scanning.
+    """
+
+    def __init__(self, filepath=None, port=None, cxn=(9600, 1, ), mode="md", **kwargs):
+        self.link = None
+        self.parser = None
+        self.error = None
+        self.file = filepath
+        self.serial_port = port
+        self.cxn = cxn
+        self.run_mode = mode
+        self.cache = kwargs.pop("cache", None)
+        self.chunk = kwargs.pop("chunk", CHUNK)
+        self.progress = kwargs.pop("progress", None)
+        self.wait = kwargs.pop("wait", 0)
+
+    async def connect(self, timeout=None):
+        """Create a link, initiate, and test connection, scanning for the port if needed."""
+        if self.link is not None:
+            await self.link.shutdown()
+            self.link = None
+        if not self.serial_port or self.serial_port == "None":
+            print("Scanning for MegaEverdrive...")
+            scanner = AsyncLink(None)
+            try:
+                probed = await scanner.step(scanner.call(discover, self.cxn[0], self.cxn[1],
+                                                         self.wait), timeout)
+            finally:
+                scanner.executor.shutdown(False)
+            if probed is None:
+                print("ERROR: No compatible serial port found.")
+                self.error = 1
+                return self.error
+            self.serial_port = probed.port
+            self.link = AsyncLink(probed.port, link=probed)
+            self.error = None
+            return self.error
+        self.link = AsyncLink(self.serial_port, self.cxn[0], self.cxn[1])
+        self.error = await self.link.setup(timeout)
+        if not self.error:
+            self.error = await self.link.test(timeout)
+        if not self.error:
+            await self.link.call(remember, self.serial_port)
+        return self.error
+
+    async def load(self):
+        """Load and identify the image file, on the default executor."""
+        loop = asyncio.get_running_loop()
+        self.parser = await loop.run_in_executor(None, Parser, self.file, self.cache)
+        await loop.run_in_executor(None, self.parser.ident, self.run_mode)
+
+    async def send(self, timeout=None):
+        """Send loaded image to Everdrive link."""
+        self.error = await self.link.transfer(self.parser.image, self.chunk, self.progress,
+                                              timeout)
+        return self.error
+
+    async def run(self, timeout=None):
+        """Launch image, using specified run mode of application."""
+        self.error = await self.link.run(self.run_mode, timeout)
+        if not self.error:
+            print("Starting....")
+        return self.error
+
+    async def init(self, timeout=None):
+        """Load file and connect to Everdrive, at the same time."""
+        await asyncio.gather(self.load(), self.connect(timeout))
+        return self.error
+
+    async def start(self, timeout=None):
+        """Send and tell Everdrive to start."""
+        if not self.error:
+            await self.send(timeout)
+        if not self.error:
+            await self.run()
+        return self.error
+
+    async def close(self):
+        """Close the link."""
+        if self.link is not None:
+            await self.link.shutdown()
+            self.link = None
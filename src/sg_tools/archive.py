@@ -0,0 +1,121 @@
+#!/usr/bin/python
+"""
+Reading of images stored in zip and gzip archives.
+
+Archives are recognized by their magic bytes, whatever their file extension: see magic. A zip
+archive is read through its first member with an image file extension, or its largest member
+otherwise. Members are decompressed as a stream, so reading the header windows inflates only the
+start of an image, and loading a whole image writes it straight into one buffer, without a
+temporary file.
+
+Requires Python 2.7+ for zipfile member streams and memoryview.
+"""
+
+import struct
+import zlib
+
+# File extensions of images, in order of preference within a zip archive
+EXTENSIONS = (".bin", ".md", ".gen", ".smd", ".32x", ".sms", ".gg", ".sg", ".rom")
+# Bytes decompressed per read when loading a whole image
+STEP = 512 * 1024
+
+
+def member(archive):
+    """Return the ZipInfo of the image in a zip archive."""
+    infos = [info for info in archive.infolist() if not info.filename.endswith("/")]
+    if not infos:
+        raise IOError("Empty zip archive")
+    for extension in EXTENSIONS:
+        for info in infos:
+            if info.filename.lower().endswith(extension):
+                return info
+    return max(infos, key=lambda info: info.file_size)
+
+
+def open_stream(file, kind):
+    """
+    Return a decompressed stream of the image in an open archive, and its size.
+
+    The size of a gzip image is taken from the trailer of the archive, which only holds it
+    modulo 4GB, and only for single member archives, so it is a hint.
+    """
+    if kind == "zip":
+        # pylint: disable-next=import-outside-toplevel
+        import zipfile
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipfile:
+            # pylint: disable-next=raise-missing-from
+            raise IOError("Invalid zip archive")
+        info = member(archive)
+        return archive.open(info), info.file_size
+    # pylint: disable-next=import-outside-toplevel
+    import gzip
+    file.seek(-4, 2)
+    length = struct.unpack("<I", file.read(4))[0]
+    file.seek(0)
+    return gzip.GzipFile(fileobj=file, mode="rb"), length
+
+
+def prefix(file, kind, length):
+    """
+    Return up to length bytes from the start of the image in an open archive.
+
+    Only as much of the archive is decompressed as the bytes returned need.
+    """
+    stream = open_stream(file, kind)[0]
+    try:
+        return stream.read(length)
+    except (EOFError, zlib.error):
+        # pylint: disable-next=raise-missing-from
+        raise IOError("Truncated or corrupt %s archive" % kind)
+    finally:
+        stream.close()
+
+
+def size(file, kind):
+    """Return the decompressed size of the image in an open archive, a hint for gzip."""
+    stream, length = open_stream(file, kind)
+    stream.close()
+    return length
+
+
+def load(file, kind, limit=None):
+    """
+    Decompress the image in an open archive into a new buffer.
+
+    Keywords:
+        file -- file object of the archive
+        kind -- string, zip or gzip
+        limit -- integer, the largest image accepted, or None
+    The buffer is allocated once at the size of the image, and the archive is decompressed into
+    it a piece at a time. Raises ValueError if the image is larger than the limit.
+    """
+    stream, length = open_stream(file, kind)
+    try:
+        if limit is not None and length > limit:
+            raise ValueError("Image is too large, %d bytes" % length)
+        data = bytearray(length)
+        view = memoryview(data)
+        filled = 0
+        while filled < length:
+            count = stream.readinto(view[filled:filled + STEP])
+            if not count:
+                break
+            filled += count
+        del view  # drops the export of the buffer, so it can be resized
+        if filled < length:
+            del data[filled:]
+        while True:  # gzip sizes are hints
+            rest = stream.read(STEP)
+            if not rest:
+                break
+            data.extend(rest)
+            if limit is not None and len(data) > limit:
+                raise ValueError("Image is too large, over %d bytes" % limit)
+        return data
+    except (EOFError, zlib.error):
+        # pylint: disable-next=raise-missing-from
+        raise IOError("Truncated or corrupt %s archive" % kind)
+    finally:
+        stream.close()
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+"""
+Batch decoding of many image headers, across a process pool.
+
+Directories are walked, and the header windows of each image are read by a thread pool ahead
+of a process pool decoding them, so results come back as each image finishes. One bad or slow
+image does not stop a batch: its error is returned with its path, and decodes past their time
+limit are abandoned. Records of every image can be written out as NDJSON or CSV.
+
+Kept apart from header, so that reading a single header does not need any of this.
+
+Requires Python 2.6+, and 3.2+ or the futures backport for the process pool.
+"""
+
+import os
+import stat
+import sys
+
+from sg_tools import decoder, disc, header, instrument, magic
+
+# Images read ahead of the decoding processes, per process
+PREFETCH = 4
+
+
+class ScanTimeout(Exception):
+    """Exception class for an image that took longer than its time limit to read or decode."""
+
+    def __init__(self):
+        self.message = "Time limit exceeded"
+        Exception.__init__(self, self.message)
+
+
+def walk(paths):
+    """Yield every file path given, descending into any directories given."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+
+def prefetch(path):
+    """Read the header windows of a file image into memory, decompressing archives."""
+    if not stat.S_ISREG(os.stat(path)[stat.ST_MODE]):
+        raise IOError("Not a regular file: %s" % path)
+    if path.lower().endswith(".cue"):
+        return disc.read(path)
+    file = open(path, "rb")
+    try:
+        data = file.read(header.WINDOW)
+        kind = magic.compressed(data)
+        if kind is not None:
+            # pylint: disable-next=import-outside-toplevel
+            from sg_tools import archive
+            file.seek(0)
+            data = archive.prefix(file, kind, header.WINDOW)
+        return data
+    finally:
+        file.close()
+
+
+def expire(signum, frame):
+    """Signal handler for a decode running past its time limit."""
+    raise ScanTimeout()
+
+
+def decode(path, data, timeout=None):
+    """
+    Decode the prefetched header windows of a file image.
+
+    Keywords:
+        path -- string
+        data -- string of bytes
+        timeout -- number of seconds, or None
+    Returns a tuple of the path, the Header or None, and an error message or None. Errors are
+    returned rather than raised, so one bad image does not stop a batch.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import signal
+    timed = timeout and hasattr(signal, "setitimer")
+    if timed:
+        signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            keys = header.populate(decoder.view(header.normalize(data)[0]), False)
+        finally:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    # pylint: disable-next=broad-except
+    except Exception:
+        return path, None, str(sys.exc_info()[1]) or sys.exc_info()[0].__name__
+    keys.path = path
+    return path, keys, None
+
+
+def iter_results(paths, jobs=None, timeout=None, cache=None):
+    """
+    Decode many file images, yielding results as they finish.
+
+    Keywords:
+        paths -- list of file and directory paths
+        jobs -- number of decoding processes, or None for one per CPU
+        timeout -- time limit per file in seconds, or None
+        cache -- Cache object, or None
+    Images with a current header in the cache are not read at all. Header windows are read by a
+    thread pool ahead of a process pool running populate(). Each result is a tuple of the path,
+    the Header or None, and an error message or None. With one job, or without
+    concurrent.futures, images are decoded one at a time in this process.
+    """
+    try:
+        # pylint: disable-next=import-outside-toplevel
+        from concurrent import futures
+    except ImportError:
+        jobs = 1
+    if jobs == 1:
+        for path in walk(paths):
+            keys = cache is not None and cache.get(path)
+            if keys:
+                yield path, keys, None
+                continue
+            mark = instrument.begin("read")
+            try:
+                data = prefetch(path)
+            except EnvironmentError:
+                instrument.end(mark)
+                yield path, None, str(sys.exc_info()[1])
+                continue
+            instrument.end(mark)
+            result = decode(path, data, timeout)
+            if cache is not None and result[1] is not None:
+                cache.put(path, result[1])
+            yield result
+        return
+
+    # pylint: disable-next=import-outside-toplevel
+    from multiprocessing import cpu_count
+    # pylint: disable-next=import-outside-toplevel
+    from time import time
+    jobs = jobs or cpu_count()
+    decoders = futures.ProcessPoolExecutor(jobs)
+    readers = futures.ThreadPoolExecutor(jobs * PREFETCH)
+    limit = jobs * PREFETCH * 2
+    pending = {}
+    queue = walk(paths)
+    try:
+        while True:
+            while len(pending) < limit:
+                path = next(queue, None)
+                if path is None:
+                    break
+                keys = cache is not None and cache.get(path)
+                if keys:
+                    yield path, keys, None
+                    continue
+                pending[readers.submit(prefetch, path)] = (path, time(), False)
+            if not pending:
+                break
+            done = futures.wait(pending, timeout, futures.FIRST_COMPLETED)[0]
+            for future in done:
+                path, started, decoding = pending.pop(future)
+                try:
+                    result = future.result()
+                # pylint: disable-next=broad-except
+                except Exception:
+                    yield path, None, str(sys.exc_info()[1]) or sys.exc_info()[0].__name__
+                    continue
+                if decoding:
+                    if cache is not None and result[1] is not None:
+                        cache.put(path, result[1])
+                    yield result
+                else:
+                    future = decoders.submit(decode, path, result, timeout)
+                    pending[future] = (path, time(), True)
+            if timeout:
+                now = time()
+                for future, (path, started, decoding) in list(pending.items()):
+                    if now - started > timeout * 2:  # decoders time themselves out first
+                        del pending[future]
+                        future.cancel()
+                        yield path, None, ScanTimeout().message
+    finally:
+        # Wait for the workers to exit unless decodes were left running, as on a timeout
+        readers.shutdown(not pending)
+        decoders.shutdown(not pending)
+
+
+def iter_headers(paths, jobs=None, timeout=None, cache=None):
+    """Yield a Header for every valid file image found, without printing."""
+    for result in iter_results(paths, jobs, timeout, cache):
+        if result[1] is not None:
+            yield result[1]
+
+
+def columns(identified=False):
+    """Return the field names of every header format in FORMATS, for batch output."""
+    names = ["path"]
+    for key in ["md"] + sorted(header.FORMATS):
+        for field, spec in header.FORMATS[key]:
+            if field not in names and len(spec) > 2:
+                names.append(field)
+    if identified:
+        names.extend(["dat_title", "dat_revision"])
+    names.append("error")
+    return names
+
+
+def flatten(value):
+    """Return a header value as a string for CSV output."""
+    if isinstance(value, tuple):
+        return "; ".join([flatten(item) for item in value])
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return decoder.raw(bytearray(value))
+    return str(value)
+
+
+def catalog(paths, form="ndjson", stream=sys.stdout, **kwargs):
+    """
+    Write one record per file image to a stream as each one finishes.
+
+    Keywords:
+        paths -- list of file and directory paths
+        form -- string, either ndjson or csv
+        stream -- file object
+        index -- DAT Index to identify images against, or None
+    Remaining keywords are passed to iter_results(). Returns the number of images that failed.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import csv
+    # pylint: disable-next=import-outside-toplevel
+    import json
+    index = kwargs.pop("index", None)
+    failed = 0
+    writer = None
+    if form == "csv":
+        writer = csv.DictWriter(stream, columns(index is not None), restval="")
+        writer.writeheader()
+    for path, keys, error in iter_results(paths, **kwargs):
+        values = {"path": path}
+        if keys is not None:
+            values = keys.record()
+        # Images without a valid header are identified too, since DATs list headerless dumps
+        if index is not None:
+            try:
+                entry = index.identify(path) or {}
+            except (EnvironmentError, ValueError):
+                entry = {}
+            values["dat_title"] = entry.get("title")
+            values["dat_revision"] = entry.get("revision")
+        values["error"] = error
+        failed += error is not None
+        if writer:
+            writer.writerow(dict([(name, flatten(value)) for name, value in values.items()
+                                  if value is not None]))
+        else:
+            stream.write(json.dumps(values, default=flatten, ensure_ascii=False) + "\n")
+        stream.flush()
+    return failed
@@ -0,0 +1,327 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+"""
+Benchmarks of header decoding and image loading, over a synthetic image corpus.
+
+A corpus of synthetic images is generated: 16-bit and 32X headers with every SRAM, modem and
+region variant, 8-bit headers at every offset and with an SDSC header, SG-1000 images, and disc
+images, in sizes from 8KB to 15MB. The hot paths (header.load, decoder.scan, Header.retrieve,
+each decoder function, batch output of every header format with batch.catalog, and edsend's
+Parser) are timed separately, with the peak memory of a call traced. The startup of the sg-tools
+command line is timed in new interpreters. Results can be saved as a baseline
+and compared against on later runs, so slowdowns show up immediately.
+
+Run once with SG_TOOLS_DECODER=tuple to compare against the tuple decoder backend.
+
+Requires Python 3.4+ for tracemalloc.
+"""
+
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from sg_tools import batch, decoder, header
+
+USAGE = """Usage: %s [options]
+Time header decoding and image loading over a synthetic image corpus
+Options:
+    -b  Baseline file to compare against (default bench-baseline.json)
+    -s  Save the results as the new baseline
+    -d  Directory to generate the corpus in (default: temporary)
+    -r  Slowdown ratio reported as a regression (default 1.5)
+
+    -h  Print this help message"""
+
+KB = 1024
+MB = 1024 * KB
+# SRAM fields: none, 16-bit, 8-bit even and odd, with and without backup, and EEPROM
+EXTRAS = {"none": b" " * 12,
+          "16bit": b"RA\xa0\x20\x00\x20\x00\x00\x00\x20\x3f\xff",
+          "16bit-backup": b"RA\xe0\x20\x00\x20\x00\x00\x00\x20\x3f\xff",
+          "even": b"RA\xb0\x20\x00\x20\x00\x00\x00\x20\x3f\xfe",
+          "even-backup": b"RA\xf0\x20\x00\x20\x00\x00\x00\x20\x3f\xfe",
+          "odd": b"RA\xb8\x20\x00\x20\x00\x01\x00\x20\x3f\xff",
+          "odd-backup": b"RA\xf8\x20\x00\x20\x00\x01\x00\x20\x3f\xff",
+          "eeprom": b"RA\xe8\x40\x00\x20\x00\x01\x00\x20\x00\x01"}
+# Modem fields: none, and every support code
+MODEMS = dict([("none", b" " * 12)] +
+              [("code%s" % code, b"MOT-0700.1" + code.encode() + b"0") for code in
+               ["0", "1", "2", "3", "4", "5", "6", "7"]])
+# Region fields: old style letters, and new style hex digits
+REGIONS = {"JUE": b"JUE", "J": b"J  ", "U": b"U  ", "E": b"E  ", "hex1": b"1  ",
+           "hex4": b"4  ", "hex8": b"8  ", "hexF": b"F  "}
+# 8-bit region and size nibbles
+M3REGIONS = [0x3, 0x4, 0x5, 0x6, 0x7]
+SMS_SIZES = {0xc: 32 * KB, 0xe: 64 * KB, 0xf: 128 * KB, 0x0: 256 * KB, 0x1: 512 * KB}
+
+
+def synth_md(size, system=b"SEGA MEGA DRIVE ", extra=EXTRAS["none"], modem=MODEMS["none"],
+             region=b"JUE"):
+    """Return a synthetic 16-bit image with the header fields given."""
+    image = bytearray(size)
+    block = (system.ljust(16) + b"(C)SEGA 2022.MAY" +
+             "ソニック・ザ・ヘッジホッグ".encode("cp932").ljust(48) +
+             b"SYNTHETIC IMAGE".ljust(48) + b"GM 00001234-00" + b"\x00\x00" +
+             b"J6".ljust(16) + struct.pack(">II", 0, size - 1) +
+             struct.pack(">II", 0xff0000, 0xffffff) + extra + modem + b" " * 40 + region)
+    image[0x100:0x100 + len(block)] = block
+    return image
+
+
+def synth_sms(size, offset=0x7ff0, region=0x4, code=0xc):
+    """Return a synthetic 8-bit image with a header at the offset given."""
+    image = bytearray(size)
+    image[offset:offset + 16] = (b"TMR SEGA\x00\x00\x00\x00\x26\x70\x00" +
+                                 struct.pack("B", region << 4 | code))
+    return image
+
+
+def synth_sdsc(size, version=b"\x01\x02", date=b"\x25\x12\x07\x20"):
+    """Return a synthetic 8-bit image with an SDSC homebrew header before its header at 0x7ff0."""
+    image = synth_sms(size)
+    image[0x7fe0:0x7fea] = b"SDSC" + version + date
+    return image
+
+
+def synth_sg(size):
+    """Return a synthetic SG-1000 image, with only its start up code to show."""
+    image = bytearray(size)
+    image[0:4] = b"\xf3\xed\x56\xc3"
+    return image
+
+
+def synth_cd(size):
+    """Return a synthetic Sega CD/Mega CD disc image, with its system area at the start."""
+    image = synth_md(size, b"SEGA MEGA-CD")
+    image[0:0x60] = (b"SEGADISCSYSTEM  " + b"SYNTHETIC".ljust(16) + b"SYNTHETIC".ljust(48) +
+                     b"05202022".ljust(16))
+    return image
+
+
+def corpus(directory):
+    """
+    Write a synthetic image corpus to a directory.
+
+    Returns a dict of image names to paths. Names start with md, 32x, sms, sg, or cd, and include
+    the variant and size of the image.
+    """
+    images = {}
+    for name, extra in EXTRAS.items():
+        images["md-extra-%s" % name] = synth_md(128 * KB, extra=extra)
+    for name, modem in MODEMS.items():
+        images["md-modem-%s" % name] = synth_md(128 * KB, modem=modem)
+    for name, region in REGIONS.items():
+        images["md-region-%s" % name] = synth_md(128 * KB, region=region)
+    for size in (32 * KB, 512 * KB, 1 * MB, 4 * MB, 15 * MB):
+        images["md-%dk" % (size // KB)] = synth_md(size)
+    for size in (1 * MB, 4 * MB):
+        images["32x-%dk" % (size // KB)] = synth_md(size, b"SEGA 32X")
+    for region in M3REGIONS:
+        for code, size in SMS_SIZES.items():
+            images["sms-7ff0-r%x-%dk" % (region, size // KB)] = synth_sms(size, 0x7ff0, region,
+                                                                          code)
+        images["sms-81f0-r%x-64k" % region] = synth_sms(64 * KB, 0x81f0, region, 0xc)
+    images["sms-sdsc-r4-32k"] = synth_sdsc(32 * KB)
+    images["sms-3ff0-r4-16k"] = synth_sms(16 * KB, 0x3ff0, 0x4, 0xb)
+    images["sms-1ff0-r4-8k"] = synth_sms(8 * KB, 0x1ff0, 0x4, 0xa)
+    images["sg-32k"] = synth_sg(32 * KB)
+    images["cd-512k"] = synth_cd(512 * KB)
+    paths = {}
+    for name, image in images.items():
+        paths[name] = os.path.join(directory, name + ".bin")
+        file = open(paths[name], "wb")
+        file.write(image)
+        file.close()
+    return paths
+
+
+def measure(function):
+    """
+    Time a call and trace its peak memory.
+
+    Returns the best time per call in seconds, from five runs of enough calls to take at least
+    20ms each, and the peak memory allocated during one call in bytes.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < 0.02:
+        number *= 4
+    best = min(timer.repeat(5, number)) / number
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def quiet(function, *args):
+    """Return a function calling another with its output discarded."""
+    def call():
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            return function(*args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return call
+
+
+def window(path):
+    """Return a memoryview of the header windows of an image file."""
+    file = open(path, "rb")
+    try:
+        return memoryview(file.read(header.WINDOW))
+    finally:
+        file.close()
+
+
+def startup(*args):
+    """Return a function running the sg-tools command line in a new interpreter."""
+    command = [sys.executable, "-m", "sg_tools.cli"] + list(args)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(header.__file__)))
+    environment = dict(os.environ, PYTHONPATH=package)
+
+    def call():
+        devnull = open(os.devnull, "w")
+        try:
+            return subprocess.call(command, stdout=devnull, stderr=devnull, env=environment)
+        finally:
+            devnull.close()
+    return call
+
+
+def cases(paths):
+    """Return a sorted list of benchmark names and the functions they time."""
+    found = {}
+    for name, path in paths.items():
+        if name.split("-")[1] in ("extra", "modem", "region") or \
+                (name.startswith("sms") and "-r4-" not in name):
+            continue
+        found["header.load[%s]" % name] = quiet(header.load, path, False)
+
+    for name in ("md-extra-none", "32x-1024k", "sms-7ff0-r4-32k", "sms-81f0-r4-64k"):
+        found["decoder.scan[%s]" % name] = lambda data=window(paths[name]): decoder.scan(data)
+
+    for name, section in (("md-extra-odd-backup", None), ("md-extra-eeprom", None),
+                          ("md-modem-code5", None), ("md-region-hexF", None),
+                          ("sms-7ff0-r4-32k", "7f"), ("sms-81f0-r4-64k", "81")):
+        if section is None:
+            found["Header.retrieve[%s]" % name] = lambda data=window(paths[name]): \
+                header.Header.smd().retrieve(data)
+        else:
+            found["Header.retrieve[%s]" % name] = lambda data=window(paths[name]), \
+                section=section: header.Header.sms(section).retrieve(data)
+
+    md = window(paths["md-modem-code5"]).tobytes()
+    sram = window(paths["md-extra-odd-backup"]).tobytes()
+    sms = window(paths["sms-7ff0-r4-32k"]).tobytes()
+    segments = {"string": md[0x120:0x150], "raw": md[0x18e:0x190], "integer": md[0x1a4:0x1a8],
+                "alloc": md[0x1a0:0x1a8], "peripheral": md[0x190:0x1a0],
+                "sram": sram[0x1b0:0x1bc], "modem": md[0x1bc:0x1c8], "locale": md[0x1f0:0x1f3],
+                "raw_be": sms[0x7ffc:0x7fff], "nibble_lsb": sms[0x7ffe:0x7fff],
+                "sizes": sms[0x7fff:0x8000], "m3locale": sms[0x7fff:0x8000]}
+    for name, segment in segments.items():
+        found["decoder.%s" % name] = lambda function=getattr(decoder, name), \
+            segment=segment: function(segment)
+
+    for args in (("send", "-h"), ("header", "-h"), ("header", paths["md-512k"]),
+                 ("checksum", paths["md-512k"])):
+        found["startup[%s]" % " ".join([args[0]] + [os.path.basename(arg) for arg in args[1:]])] \
+            = startup(*args)
+
+    # Batch output of every header format, one image of each
+    sample = [paths[name] for name in ("md-512k", "32x-1024k", "sms-7ff0-r4-32k",
+                                       "sms-81f0-r4-64k", "sms-3ff0-r4-16k", "sms-1ff0-r4-8k",
+                                       "sms-sdsc-r4-32k", "sg-32k", "cd-512k")]
+    for form in ("ndjson", "csv"):
+        found["batch.catalog[%s]" % form] = lambda form=form: \
+            batch.catalog(sample, form, io.StringIO(), jobs=1)
+
+    # pylint: disable-next=import-outside-toplevel
+    from sg_tools.edsend import Parser
+    for name in ("md-512k", "md-4096k", "md-15360k", "sms-7ff0-r4-512k"):
+        parser = quiet(Parser, paths[name])()
+        found["Parser.load[%s]" % name] = parser.load
+        found["Parser.format[%s]" % name] = parser.format
+    return sorted(found.items())
+
+
+def run(directory=None):
+    """Generate a corpus, and return the time and peak memory of every benchmark."""
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix="sg_tools-bench-")
+    try:
+        results = {}
+        for name, function in cases(corpus(directory)):
+            results[name] = dict(zip(("time", "peak"), measure(function)))
+        return results
+    finally:
+        if temporary:
+            shutil.rmtree(directory)
+
+
+def compare(results, baseline, ratio):
+    """
+    Display the results against a baseline.
+
+    Returns the names of benchmarks slower than the baseline by more than the ratio given.
+    """
+    slower = []
+    print("%-44s %12s %10s %10s" % ("Benchmark", "Time (us)", "Peak (kB)", "Baseline"))
+    for name in sorted(results):
+        time, peak = results[name]["time"], results[name]["peak"]
+        change = ""
+        if name in baseline:
+            change = "%.2fx" % (time / baseline[name]["time"])
+            if time > baseline[name]["time"] * ratio:
+                change += " SLOWER"
+                slower.append(name)
+        print("%-44s %12.2f %10.1f %10s" % (name, time * 1e6, peak / 1024.0, change))
+    return slower
+
+
+def parse_options():
+    """Parse arguments from command line."""
+    if "-h" in sys.argv:
+        print(USAGE % sys.argv[0])
+        raise SystemExit(0)
+    options = {"-b": "bench-baseline.json", "-r": "1.5", "-d": None}
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg == "-s":
+            options[arg] = True
+        elif arg in ["-b", "-d", "-r"]:
+            options[arg] = next(args, None)
+        else:
+            print(USAGE % sys.argv[0])
+            raise SystemExit(1)
+    return options
+
+
+if __name__ == "__main__":
+    opts = parse_options()
+    previous = {}
+    if os.path.isfile(opts["-b"]):
+        stream = open(opts["-b"])
+        previous = json.load(stream)
+        stream.close()
+    print("Decoder backend: %s" % decoder.BACKEND)
+    timings = run(opts["-d"])
+    regressions = compare(timings, previous, float(opts["-r"]))
+    if "-s" in opts:
+        stream = open(opts["-b"], "w")
+        json.dump(timings, stream, indent=1, sort_keys=True)
+        stream.close()
+        print("Saved baseline to %s" % opts["-b"])
+    elif regressions:
+        print("%d benchmarks slower than baseline" % len(regressions))
+        raise SystemExit(1)
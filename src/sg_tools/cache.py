@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+"""
+Persistent cache of decoded image headers.
+
+Decoded headers are kept in an SQLite database in the user's cache directory, keyed on the path,
+size and modification time of each image, and of the data track of a CUE sheet. Optionally, a
+hash of the header windows is kept as well, so an image that was touched but not changed is
+still a hit. Repeat scans of an unchanged library cost a stat() per image.
+
+Requires Python 2.5+ for sqlite3.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+from time import time
+
+from sg_tools import disc
+from sg_tools.header import WINDOW, Header, shape
+
+USAGE = """Usage: %s [command]
+Manage the header cache
+Commands:
+    info    Print the location, number of entries and size of the cache (default)
+    prune   Remove entries for images that no longer exist
+    clear   Remove every entry
+
+    -h  Print this help message"""
+
+# Bump whenever pickled headers change shape, to drop entries made by older versions
+VERSION = 2
+# Default bound on the total size of cached headers, in bytes
+LIMIT = 32 * 1024 * 1024
+# Puts between commits
+BATCH = 256
+
+
+def location():
+    """Return the default path of the cache database for this user."""
+    path = os.environ.get("SG_TOOLS_CACHE")
+    if path:
+        return path
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "sg_tools", "headers.sqlite")
+
+
+def files(path):
+    """Return the files the header of an image is read from: a CUE sheet and its data track."""
+    if path.lower().endswith(".cue"):
+        return [path, disc.track(path)[0]]
+    return [path]
+
+
+def key(path):
+    """
+    Return the size and modification time of an image, in nanoseconds.
+
+    For a CUE sheet, the sizes of the sheet and its data track are added up, and the latest of
+    their modification times is taken, so replacing the track alone makes the entry stale.
+    """
+    size = mtime = 0
+    for name in files(path):
+        info = os.stat(name)
+        try:
+            stamp = info.st_mtime_ns
+        except AttributeError:
+            stamp = int(info.st_mtime * 1000000000)
+        size += info.st_size
+        mtime = max(mtime, stamp)
+    return size, mtime
+
+
+def digest(path):
+    """Return the SHA-1 hash of the header windows of a file, or of a CUE sheet and its header."""
+    file = open(path, "rb")
+    try:
+        hashed = hashlib.sha1(file.read(WINDOW))
+    finally:
+        file.close()
+    if path.lower().endswith(".cue"):
+        hashed.update(disc.read(path))
+    return hashed.hexdigest()
+
+
+class Cache:
+    """
+    Cache of decoded image headers, stored in SQLite.
+
+    Attributes:
+        path -- string
+    Path of the cache database.
+        limit -- integer
+    Bound on the total size of cached headers, in bytes. The least recently used entries are
+    evicted past it when the cache is committed.
+        hashed -- boolean
+    Whether to also check a hash of the header windows. When size and modification time differ
+    but the hash matches, the entry is still used.
+        lock -- object
+    Serializes use of the database, so a cache can be shared between threads, such as those of
+    an asyncio executor.
+    """
+
+    def __init__(self, path=None, limit=LIMIT, hashed=False):
+        self.path = path or location()
+        self.limit = limit
+        self.hashed = hashed
+        self.keys = {}
+        self.hits = {}
+        self.puts = 0
+        self.lock = threading.RLock()
+        if self.path != ":memory:" and not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != VERSION:
+            self.db.execute("DROP TABLE IF EXISTS headers")
+            self.db.execute("PRAGMA user_version = %d" % VERSION)
+        self.db.execute("CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, "
+                        "size INTEGER, mtime INTEGER, digest TEXT, header BLOB, used REAL)")
+        self.db.commit()
+
+    def get(self, path):
+        """
+        Return the cached Header of an image, or None if missing or stale.
+
+        Keyword:
+            path -- string
+        """
+        self.lock.acquire()
+        try:
+            name = os.path.abspath(path)
+            try:
+                size, mtime = self.keys[name] = key(name)
+            except EnvironmentError:
+                return None
+            row = self.db.execute("SELECT size, mtime, digest, header FROM headers WHERE path = ?",
+                                  (name, )).fetchone()
+            if row is None:
+                return None
+            if (row[0], row[1]) != (size, mtime):
+                if not self.hashed or row[0] != size:
+                    return None
+                try:
+                    if row[2] != digest(name):
+                        return None
+                except EnvironmentError:
+                    return None
+                self.db.execute("UPDATE headers SET mtime = ? WHERE path = ?", (mtime, name))
+            self.hits[name] = time()
+            form, values = pickle.loads(bytes(row[3]))
+            header = Header(shape(form), values, path)
+            return header
+        finally:
+            self.lock.release()
+
+    def put(self, path, header):
+        """
+        Store the decoded Header of an image.
+
+        Keywords:
+            path -- string
+            header -- Header object
+        The size and modification time seen by the last get() of the path are used, so an image
+        changed while it was being decoded is not mistaken for the decoded one later.
+        """
+        self.lock.acquire()
+        try:
+            path = os.path.abspath(path)
+            try:
+                size, mtime = self.keys.pop(path, None) or key(path)
+            except EnvironmentError:
+                return
+            hashed = None
+            if self.hashed:
+                hashed = digest(path)
+            # The format is stored by key, so entries do not depend on the module that made them
+            blob = pickle.dumps((header.format.key, header.values), pickle.HIGHEST_PROTOCOL)
+            self.db.execute("INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?)",
+                            (path, size, mtime, hashed, sqlite3.Binary(blob), time()))
+            self.puts += 1
+            if self.puts % BATCH == 0:
+                self.commit()
+        finally:
+            self.lock.release()
+
+    def invalidate(self, path=None):
+        """Remove the entry of an image, or every entry if no path is given."""
+        self.lock.acquire()
+        try:
+            if path is None:
+                self.db.execute("DELETE FROM headers")
+            else:
+                self.db.execute("DELETE FROM headers WHERE path = ?", (os.path.abspath(path), ))
+            self.commit()
+        finally:
+            self.lock.release()
+
+    def prune(self):
+        """Remove the entries of images that no longer exist. Return the number removed."""
+        self.lock.acquire()
+        try:
+            gone = [(row[0], ) for row in self.db.execute("SELECT path FROM headers")
+                    if not os.path.isfile(row[0])]
+            self.db.executemany("DELETE FROM headers WHERE path = ?", gone)
+            self.commit()
+            return len(gone)
+        finally:
+            self.lock.release()
+
+    def usage(self):
+        """Return the number of entries and their total size in bytes."""
+        self.lock.acquire()
+        try:
+            count, size = self.db.execute("SELECT COUNT(*), SUM(LENGTH(header)) FROM headers"
+                                          ).fetchone()
+            return count, size or 0
+        finally:
+            self.lock.release()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is within its size limit."""
+        self.lock.acquire()
+        try:
+            excess = self.usage()[1] - self.limit
+            if excess <= 0:
+                return
+            stale = []
+            for path, size in self.db.execute("SELECT path, LENGTH(header) FROM headers "
+                                              "ORDER BY used"):
+                if excess <= 0:
+                    break
+                stale.append((path, ))
+                excess -= size
+            self.db.executemany("DELETE FROM headers WHERE path = ?", stale)
+        finally:
+            self.lock.release()
+
+    def commit(self):
+        """Record which entries were used, evict past the size limit, and save to disk."""
+        self.lock.acquire()
+        try:
+            self.db.executemany("UPDATE headers SET used = ? WHERE path = ?",
+                                [(used, path) for path, used in self.hits.items()])
+            self.hits = {}
+            self.keys = {}
+            self.evict()
+            self.db.commit()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Commit and close the cache database."""
+        self.lock.acquire()
+        try:
+            self.commit()
+            self.db.close()
+        finally:
+            self.lock.release()
+
+
+if __name__ == "__main__":
+    if "-h" in sys.argv:
+        print(USAGE % sys.argv[0])
+        raise SystemExit(0)
+    command = (sys.argv[1:] or ["info"])[0]
+    cache = Cache()
+    if command == "prune":
+        print("Removed %d entries" % cache.prune())
+    elif command == "clear":
+        cache.invalidate()
+    elif command != "info":
+        print(USAGE % sys.argv[0])
+        raise SystemExit(1)
+    print("%s: %d entries, %d bytes" % ((cache.path, ) + cache.usage()))
+    cache.close()
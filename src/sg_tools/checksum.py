@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+"""
+Checksum verification for Sega 8-bit and 16-bit images.
+
+The checksum stored in the header is compared against one computed over the image, the way the
+console or its BIOS computes it:
+
+Genesis/Mega Drive, 32X, and SSF-size images
+    16-bit big-endian word sum from 0x200 to the end of the image.
+Master System/Mark III and Game Gear
+    16-bit sum of bytes over the ranges implied by the size nibble of the header, excluding the
+    header itself (except for 48KB images, where the BIOS sums over it).
+
+Sums are computed over a memory map of the image, with NumPy when available, or with the
+C-level byte summing of Python otherwise. NumPy is only imported once a sum is computed.
+Images in zip and gzip archives are decompressed into memory first, and interleaved or
+byte-swapped images are converted to plain images.
+
+Requires Python 3.2+ for memoryviews of memory maps.
+"""
+
+import mmap
+import sys
+
+from sg_tools import decoder, dump, magic
+from sg_tools.decoder import ValidationError
+
+USAGE = """Usage: %s file...
+Verify the header checksum of Sega images
+
+    -h  Print this help message"""
+
+# Checksum ranges of 8-bit images, by size nibble, relative to a header at 0x7ff0
+RANGES = {0xa: ((0x0, 0x1ff0), ), 0xb: ((0x0, 0x3ff0), ), 0xc: ((0x0, 0x7ff0), ),
+          0xd: ((0x0, 0xbff0), ), 0xe: ((0x0, 0x7ff0), (0x8000, 0x10000)),
+          0xf: ((0x0, 0x7ff0), (0x8000, 0x20000)), 0x0: ((0x0, 0x7ff0), (0x8000, 0x40000)),
+          0x1: ((0x0, 0x7ff0), (0x8000, 0x80000)), 0x2: ((0x0, 0x7ff0), (0x8000, 0x100000))}
+
+
+def bytesum(data):
+    """Return the sum of a buffer of bytes."""
+    numpy = dump.accelerator()
+    if numpy is not None:
+        return int(numpy.frombuffer(data, numpy.uint8).sum(dtype=numpy.uint64))
+    return sum(data)
+
+
+def wordsum(data):
+    """
+    Return the sum of a buffer of 16-bit big-endian words, modulo 0x10000.
+
+    An odd trailing byte is summed as the high byte of a word padded with 0.
+    """
+    numpy = dump.accelerator()
+    if numpy is not None:
+        words = numpy.frombuffer(data[:len(data) & ~1], ">u2")
+        total = int(words.sum(dtype=numpy.uint64))
+        if len(data) & 1:
+            total += data[-1] << 8
+        return total & 0xffff
+    return ((bytesum(data[0::2]) << 8) + bytesum(data[1::2])) & 0xffff
+
+
+def smd(data):
+    """
+    Verify the checksum of a 16-bit image.
+
+    Keyword:
+        data -- memoryview of the image
+    Raises ValidationError if the image ends within its header.
+    """
+    if len(data) < 0x200:
+        raise ValidationError()
+    stored = (data[0x18e] << 8) | data[0x18f]
+    computed = wordsum(data[0x200:])
+    romrange = ((data[0x1a4] << 24) | (data[0x1a5] << 16) | (data[0x1a6] << 8) | data[0x1a7]) + 1
+    return {"mode": "md", "stored": stored, "computed": computed, "match": stored == computed,
+            "romrange": romrange, "consistent": romrange == len(data)}
+
+
+def sms(data, section):
+    """
+    Verify the checksum of an 8-bit image.
+
+    Keywords:
+        data -- memoryview of the image
+        section -- string, the header section found by the decoder
+    Headers past 0x7ff0 are offset by a copier header, which the ranges are offset by as well.
+    Raises ValidationError if the image ends within its header.
+    """
+    header = decoder.origin(section)
+    if len(data) < header + 0x10:
+        raise ValidationError()
+    base = max(header - 0x7ff0, 0)
+    stored = data[header + 0xa] | (data[header + 0xb] << 8)
+    ranges = RANGES.get(data[header + 0xf] & 0xf)
+    if ranges is None:
+        raise ValidationError()
+    computed = 0
+    for start, end in ranges:
+        computed += bytesum(data[base + start:base + end])
+    romrange = (ranges[-1][1] + 0xff) & ~0xff  # sums stop short of the header
+    return {"mode": "sms", "stored": stored, "computed": computed & 0xffff,
+            "match": stored == computed & 0xffff, "romrange": romrange,
+            "consistent": romrange <= len(data) - base}
+
+
+def verify(filename):
+    """
+    Compute the checksum of an image file and compare it to the one in its header.
+
+    Keyword:
+        filename -- string
+    Returns a dict of the image mode, the stored and computed checksums and whether they match,
+    the size of the ROM declared by the header, and whether it fits the size of the file.
+    """
+    file = open(filename, "rb")
+    try:
+        kind = magic.detect(file)
+        if kind is not None:
+            # pylint: disable-next=import-outside-toplevel
+            from sg_tools import archive
+            image = archive.load(file, kind)
+        else:
+            image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        file.close()
+    plain = dump.normalize(image)[0]
+    size = len(plain)
+    data = memoryview(plain)
+    try:
+        mode, section = decoder.scan(data)
+        if mode in ("cd", "sg"):
+            raise ValueError("%s images have no header checksum"
+                             % {"cd": "Disc", "sg": "SG-1000"}[mode])
+        if mode == "md":
+            report = smd(data)
+        else:
+            report = sms(data, section)
+    finally:
+        data.release()
+        if hasattr(image, "close"):
+            image.close()
+    report["size"] = size
+    return report
+
+
+def display(filename, report):
+    """Display a checksum report."""
+    print("%s" % filename)
+    print("\tChecksum: %04x stored, %04x computed, %s"
+          % (report["stored"], report["computed"], ["MISMATCH", "OK"][report["match"]]))
+    print("\tSize: %d bytes, %d declared, %s"
+          % (report["size"], report["romrange"], ["INCONSISTENT", "OK"][report["consistent"]]))
+
+
+if __name__ == "__main__":
+    if "-h" in sys.argv or len(sys.argv) < 2:
+        print(USAGE % sys.argv[0])
+        raise SystemExit(len(sys.argv) < 2)
+    status = 0
+    for path in sys.argv[1:]:
+        try:
+            result = verify(path)
+        except (EnvironmentError, ValueError, ValidationError):
+            print("%s\n\tERROR: %s" % (path, sys.exc_info()[1]))
+            status = 1
+            continue
+        display(path, result)
+        status = status or not result["match"]
+    raise SystemExit(status)
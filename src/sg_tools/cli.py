@@ -0,0 +1,65 @@
+#!/usr/bin/python
+"""
+Single command line entry point to SG-Tools.
+
+Subcommands run the command line of their module in this interpreter, as python -m would, so
+only the modules a subcommand needs are imported. Installed as the sg-tools, edsend, and
+sg-header console scripts.
+
+Requires Python 2.5+ for runpy.
+"""
+
+import runpy
+import sys
+
+USAGE = """Usage: %s command [options] [file...]
+Collection of developer utilities dedicated to Sega platforms
+Commands:
+    header    Display the header information of Sega images, or catalog many images
+    send      Send a file to a Mega Everdrive X7
+    checksum  Verify the header checksum of Sega images
+    daemon    Keep a Mega Everdrive X7 connected, and send images to it
+    dat       Identify images against DAT files of known dumps
+    dupes     Find duplicate and overdumped images
+
+    -h  Print this help message, or the help of a command after it"""
+
+COMMANDS = {"header": "sg_tools.header", "send": "sg_tools.edsend",
+            "checksum": "sg_tools.checksum", "daemon": "sg_tools.daemon",
+            "dat": "sg_tools.dat", "dupes": "sg_tools.dupes"}
+
+
+def run(command, args):
+    """
+    Run the command line of a subcommand module with the arguments given.
+
+    Keywords:
+        command -- string, a key of COMMANDS
+        args -- list of arguments
+    The module is run as __main__, so its functions can be sent to worker processes.
+    """
+    sys.argv = sys.argv[:1] + list(args)
+    runpy.run_module(COMMANDS[command], run_name="__main__", alter_sys=True)
+
+
+def main():
+    """Run the sg-tools command line."""
+    args = sys.argv[1:]
+    if not args or args[0] not in COMMANDS:
+        print(USAGE % sys.argv[0])
+        raise SystemExit(not args or args[0] not in ["-h", "--help"])
+    run(args[0], args[1:])
+
+
+def header():
+    """Run the sg-header command line."""
+    run("header", sys.argv[1:])
+
+
+def send():
+    """Run the edsend command line."""
+    run("send", sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
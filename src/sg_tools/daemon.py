@@ -0,0 +1,425 @@
+#!/usr/bin/python
+"""
+Long-lived edsend daemon that keeps the Everdrive link open.
+
+The daemon owns a connected Loader and takes send and run requests over a local Unix socket, and
+optionally over TCP. Parsed images are cached by the hash of their file, and when the image
+requested is the one already loaded on the Everdrive, only the run command is issued again.
+
+Requests and replies are single lines of JSON. Over TCP, the client streams the file after the
+daemon replies that it is ready for it, instead of naming a path on the daemon's machine. Either
+way, the file is decompressed, converted to a plain image and identified the same way before it
+is sent to the serial port. So a streamed file is received whole before any of it is sent on,
+rather than passed straight through: see Daemon.stream().
+
+TCP is served on localhost unless another host is given, which requires a token. With a token,
+every TCP request must carry it.
+
+Unix-like systems with Python 3 only.
+"""
+
+import hashlib
+import hmac
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+from sg_tools import magic
+from sg_tools.edsend import BLOCK, CHUNK, MAXROM, Loader, Parser
+
+USAGE = """Usage: %s command [options] [file]
+Keep a Mega Everdrive X7 connected, and send images to it without reconnecting
+Commands:
+    serve   Start the daemon, until stopped
+    send    Send a file and run it, only running it if already loaded
+    run     Run the loaded image again
+    stop    Stop the daemon
+Options:
+    -p  Serial port (serve)
+    -b  Baud rate (serve)
+    -t  Serial read timeout (serve)
+    -m  Everdrive run mode (send, run; default md)
+    -s  Unix socket path
+    -a  TCP address as [host:]port, localhost by default. Served in addition to the Unix
+        socket, or connected to instead of it, streaming the file.
+    -k  Token required of TCP requests, SG_TOOLS_TOKEN by default. Required to serve TCP on
+        a host other than localhost.
+
+    -h  Print this help message
+
+Example edit-build-send loop:
+    %s serve &
+    make && %s send out.bin"""
+
+# Parsed images kept, by the hash of their file
+PARSERS = 8
+# Host TCP is served on and connected to when none is given
+LOCALHOST = "127.0.0.1"
+# Commands taken over TCP, which cannot name a file on the daemon's machine
+REMOTE = ("stream", "run", "stop")
+
+
+def address():
+    """Return the default Unix socket path of the daemon for this user."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, "sg_tools-edsend-%d.sock" % os.getuid())
+
+
+def expand(data):
+    """Return the image in a buffer, decompressed if the buffer holds an archive."""
+    kind = magic.compressed(data[:4])
+    if kind is None:
+        return data
+    # pylint: disable-next=import-outside-toplevel
+    from sg_tools import archive
+    return archive.load(io.BytesIO(data), kind, MAXROM)
+
+
+def digest(data):
+    """Return the SHA-1 hash of a buffer."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def oversize(size):
+    """Raise if an image of the size given does not fit on the Everdrive."""
+    if size + -size % BLOCK > MAXROM:
+        raise ValueError("ROM file is too large, %d bytes is the maximum" % MAXROM)
+
+
+def loopback(host):
+    """Return whether a host name or address is of this machine only."""
+    return host in ("localhost", "::1") or host.startswith("127.")
+
+
+class Snapshot(Parser):
+    """
+    Parser of an image already read into memory.
+
+    Unlike a memory map, the image cannot change under the parser when it is rebuilt in place,
+    so it can be kept between requests.
+    """
+
+    def __init__(self, filename, data):
+        self.data = expand(data)
+        Parser.__init__(self, filename)
+
+    def load(self):
+        """Check the size of the image read."""
+        oversize(len(self.data))
+
+
+class Daemon:
+    """
+    Owner of the Everdrive link, serving send and run requests.
+
+    Attributes:
+        loader -- object
+    Loader holding the link to the Everdrive.
+        loaded -- string
+    Hash of the file of the image loaded on the Everdrive, or None.
+        parsers -- dict
+    Parsed images, by the hash of their file, least recently used first.
+        lock -- object
+    Serializes requests from the Unix and TCP servers.
+        token -- string
+    Token required of TCP requests, or None.
+    """
+
+    def __init__(self, port=None, cxn=(9600, 1, ), chunk=CHUNK):
+        self.loader = Loader(None, port, cxn, chunk=chunk)
+        self.loaded = None
+        self.parsers = OrderedDict()
+        self.lock = threading.Lock()
+        self.servers = []
+        self.token = None
+
+    def connect(self):
+        """Connect to the Everdrive, unless already connected."""
+        if self.loader.link is not None:
+            return
+        self.loader.connect()
+        self.check("connection")
+
+    def reset(self):
+        """Close the link, to reconnect on the next request."""
+        if self.loader.link is not None and self.loader.link.cxn is not None:
+            self.loader.link.cxn.close()
+        self.loader.link = None
+        self.loaded = None
+
+    def check(self, action):
+        """Raise if the last step of the loader failed, resetting the link."""
+        if self.loader.error:
+            self.reset()
+            raise IOError("Everdrive %s failed" % action)
+
+    def run(self, mode):
+        """Run the loaded image in the mode given."""
+        self.connect()
+        if mode.upper() not in self.loader.link.message or mode.upper() in ("INIT", "LD"):
+            raise ValueError("Invalid run mode: %s" % mode)
+        self.loader.run_mode = mode
+        self.loader.run()
+        self.check("run")
+        return {"ok": True}
+
+    def parse(self, path, data, hashed, mode):
+        """
+        Return the parser of an image file read into memory, keyed on the hash of the file.
+
+        Sent and streamed files alike are decompressed, converted to a plain image, and have
+        their header identified, unless parsed recently.
+        """
+        parser = self.parsers.pop(hashed, None)
+        if parser is None:
+            parser = Snapshot(path, data)
+            parser.ident(mode)
+        self.parsers[hashed] = parser
+        while len(self.parsers) > PARSERS:
+            self.parsers.popitem(False)
+        return parser
+
+    def load(self, path, data, hashed, mode):
+        """Send an image file read into memory and run it, only running it if already loaded."""
+        if hashed == self.loaded:
+            return dict(self.run(mode), cached=True)
+        parser = self.parse(path, data, hashed, mode)
+        self.connect()
+        self.loaded = None
+        self.loader.parser = parser
+        self.loader.send()
+        self.check("transfer")
+        self.loaded = hashed
+        return dict(self.run(mode), cached=False)
+
+    def send(self, path, mode):
+        """Send an image file and run it, only running it if it is already loaded."""
+        file = open(path, "rb")
+        try:
+            data = file.read()
+        finally:
+            file.close()
+        return self.load(path, data, digest(data), mode)
+
+    def stream(self, reader, writer, message):
+        """
+        Receive an image file from a client, then send it and run it.
+
+        The client is told to send the file only if it is not already loaded. The file is read
+        whole before any of it goes to the serial port, like a sent file: an archive is only
+        decompressed, and an interleaved image only converted, once all of it is in, which the
+        block count sent ahead of the payload depends on. The hash is checked before the
+        Everdrive is touched, so a truncated or corrupt stream never replaces the loaded image,
+        and the parsed image is kept to run again by its hash.
+        """
+        mode = message.get("mode", "md")
+        if message.get("sha1") and message["sha1"] == self.loaded:
+            return dict(self.run(mode), cached=True)
+        size = int(message["size"])
+        # Archives of the largest images are at most slightly larger than them
+        oversize(size // 2)
+        reply(writer, {"ready": True})
+        data = reader.read(size)
+        if len(data) < size:
+            raise EOFError("Client closed before sending the whole image")
+        hashed = digest(data)
+        if message.get("sha1") and message["sha1"] != hashed:
+            raise ValueError("Image does not match its hash")
+        return self.load(os.path.basename(message.get("name") or "stream"), data, hashed, mode)
+
+    def authorize(self, message):
+        """Raise unless a request received over TCP may be carried out."""
+        if message.get("command") not in REMOTE:
+            raise ValueError("Command not taken over TCP: %s" % message.get("command"))
+        if self.token is not None and \
+                not hmac.compare_digest(str(message.get("token")), self.token):
+            raise ValueError("Invalid token")
+
+    def dispatch(self, message, reader, writer, remote=False):
+        """Carry out a request, received over TCP if remote, returning the reply."""
+        if remote:
+            self.authorize(message)
+        command = message.get("command")
+        mode = message.get("mode", "md")
+        self.lock.acquire()
+        try:
+            if command == "send":
+                return self.send(message["path"], mode)
+            if command == "stream":
+                return self.stream(reader, writer, message)
+            if command == "run":
+                return self.run(mode)
+            if command == "stop":
+                threading.Thread(target=self.shutdown).start()
+                return {"ok": True}
+            raise ValueError("Unknown command: %s" % command)
+        finally:
+            self.lock.release()
+
+    def serve(self, path=None, tcp=None, token=None):
+        """
+        Serve requests on a Unix socket, and on a TCP address if given, until stopped.
+
+        Keywords:
+            path -- string, Unix socket path
+            tcp -- tuple of host and port, or None
+            token -- string required of TCP requests, or None
+        Raises ValueError for a TCP host other than localhost without a token.
+        """
+        if tcp is not None and token is None and not loopback(tcp[0]):
+            raise ValueError("A token is required to serve TCP on %s" % tcp[0])
+        self.token = token
+        path = path or address()
+        if os.path.exists(path):
+            os.remove(path)
+        self.servers.append(Server(path, self, socketserver.UnixStreamServer))
+        if tcp is not None:
+            self.servers.append(Server(tcp, self, socketserver.TCPServer))
+        for server in self.servers[1:]:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        print("Serving on %s" % ", ".join([str(server.server_address)
+                                            for server in self.servers]))
+        sys.stdout.flush()
+        try:
+            self.servers[0].serve_forever()
+        finally:
+            for server in self.servers:
+                server.server_close()
+            os.remove(path)
+            self.reset()
+
+    def shutdown(self):
+        """Stop serving requests."""
+        for server in self.servers:
+            server.shutdown()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Handler of one request to the daemon."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            result = self.server.owner.dispatch(json.loads(line.decode()), self.rfile,
+                                                self.wfile, self.server.remote)
+        # pylint: disable-next=broad-except
+        except Exception:
+            result = {"ok": False, "error": str(sys.exc_info()[1])}
+        reply(self.wfile, result)
+
+
+def Server(endpoint, owner, kind):  # pylint: disable=invalid-name
+    """Return a server of a kind bound to an address, handing requests to the daemon."""
+    kind.allow_reuse_address = True
+    server = kind(endpoint, Handler)
+    server.owner = owner
+    server.remote = kind is socketserver.TCPServer
+    return server
+
+
+def reply(writer, message):
+    """Write a JSON line to a socket file."""
+    writer.write(json.dumps(message).encode() + b"\n")
+    writer.flush()
+
+
+def request(message, path=None, tcp=None, payload=None):
+    """
+    Send a request to the daemon and return its reply.
+
+    Keywords:
+        message -- dict
+        path -- string, Unix socket path
+        tcp -- tuple of host and port, to connect over TCP instead
+        payload -- buffer of the image file, streamed if the daemon is ready for it
+    """
+    if tcp is not None:
+        connection = socket.create_connection(tcp)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path or address())
+    stream = connection.makefile("rwb")
+    try:
+        reply(stream, message)
+        answer = json.loads(stream.readline().decode() or "{}")
+        if answer.get("ready") and payload is not None:
+            stream.write(payload)
+            stream.flush()
+            answer = json.loads(stream.readline().decode() or "{}")
+        return answer
+    finally:
+        stream.close()
+        connection.close()
+
+
+def parse_options():
+    """Parse arguments from command line."""
+    if "-h" in sys.argv or len(sys.argv) < 2:
+        print(USAGE % (sys.argv[0], sys.argv[0], sys.argv[0]))
+        raise SystemExit(len(sys.argv) < 2)
+    options = {"command": sys.argv[1], "file": None}
+    args = iter(sys.argv[2:])
+    for arg in args:
+        if arg in ["-a", "-b", "-k", "-m", "-p", "-s", "-t"]:
+            options[arg] = next(args, None)
+        else:
+            options["file"] = arg
+    if "-a" in options:
+        host, port = (":" + options["-a"]).rsplit(":", 1)
+        options["-a"] = (host.lstrip(":") or LOCALHOST, int(port))
+    options["-k"] = options.get("-k") or os.environ.get("SG_TOOLS_TOKEN") or None
+    return options
+
+
+def main(options):
+    """Run a command of the daemon CLI, returning the exit status."""
+    command = options["command"]
+    if command == "serve":
+        cxn = (int(options.get("-b", 9600)), float(options.get("-t", 1)), )
+        try:
+            Daemon(options.get("-p"), cxn).serve(options.get("-s"), options.get("-a"),
+                                                 options["-k"])
+        except ValueError:
+            print("ERROR: %s" % sys.exc_info()[1])
+            return 1
+        return 0
+    message = {"command": command, "mode": options.get("-m", "md")}
+    payload = None
+    if command == "send":
+        if not options["file"]:
+            print("Filename required")
+            return 1
+        message["path"] = os.path.abspath(options["file"])
+        if "-a" in options:
+            file = open(options["file"], "rb")
+            payload = file.read()
+            file.close()
+            message = {"command": "stream", "mode": message["mode"], "size": len(payload),
+                       "sha1": digest(payload), "name": os.path.basename(options["file"])}
+    if "-a" in options and options["-k"]:
+        message["token"] = options["-k"]
+    try:
+        answer = request(message, options.get("-s"), options.get("-a"), payload)
+    except EnvironmentError:
+        print("ERROR: Cannot reach the daemon: %s" % sys.exc_info()[1])
+        return 1
+    if not answer.get("ok"):
+        print("ERROR: %s" % answer.get("error", "No reply from daemon"))
+        return 1
+    if answer.get("cached"):
+        print("Image already loaded, running it again")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(parse_options()))
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+"""
+Identification of images against DAT files of known dumps.
+
+DAT files in the Logiqx XML format used by No-Intro and Redump list every known dump of a
+platform, with the size, CRC32 and SHA-1 of each. They are parsed once into an index kept in an
+SQLite database in the user's cache directory, and parsed again only when they change.
+
+An image is identified by its size first: images of a size no dump in the index has are not
+read at all. Otherwise, the image is hashed in one pass over a memory map, computing every
+digest at once, and looked up by CRC32 and size, with the SHA-1 checked wherever the DAT has
+one. Interleaved and byte-swapped images are converted first, and images in zip and gzip
+archives decompressed, since DATs list plain images.
+
+Requires Python 2.5+ for sqlite3 and ElementTree.
+"""
+
+import binascii
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import sys
+import zlib
+
+from sg_tools import dump, magic
+
+USAGE = """Usage: %s [command] [file...]
+Manage the index of DAT files of known dumps
+Commands:
+    info    Print the location of the index, and the DATs and dumps in it (default)
+    add     Add DAT files to the index, or update those changed since they were added
+    remove  Remove DAT files from the index
+    clear   Remove every DAT
+    find    Identify image files against the index
+
+    -h  Print this help message"""
+
+# Bump whenever the tables change shape, to rebuild indexes made by older versions
+VERSION = 1
+# Bytes hashed per step
+STEP = 1024 * 1024
+# Revision in the name of a dump, such as "(Rev 1)" or "(Rev A)"
+REVISION = re.compile(r"\(Rev ([^)]+)\)")
+
+
+def location():
+    """Return the default path of the DAT index database for this user."""
+    path = os.environ.get("SG_TOOLS_DAT")
+    if path:
+        return path
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "sg_tools", "dats.sqlite")
+
+
+def parse(path):
+    """
+    Return the name of a DAT file, and a list of a tuple for every dump it lists.
+
+    Keyword:
+        path -- string
+    Each tuple holds the game name, revision, dump file name, size, CRC32 and SHA-1 digest. The
+    file is parsed as a stream, so the tree of a large DAT is never held in memory at once.
+    Raises SyntaxError for a file that is not valid XML.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from xml.etree import ElementTree
+    name = None
+    game = None
+    dumps = []
+    for event, element in ElementTree.iterparse(path, ("start", "end")):
+        if event == "start":
+            if element.tag in ("game", "machine"):
+                game = element.get("name")
+            continue
+        if element.tag == "name" and name is None:
+            name = element.text
+        elif element.tag == "rom" and game is not None:
+            crc = element.get("crc")
+            size = element.get("size")
+            if crc and size:
+                sha1 = element.get("sha1")
+                if sha1:
+                    sha1 = sqlite3.Binary(binascii.unhexlify(sha1))
+                match = REVISION.search(game)
+                dumps.append((game, match and match.group(1), element.get("name"), int(size),
+                              int(crc, 16), sha1))
+        elif element.tag in ("game", "machine"):
+            game = None
+            element.clear()
+    return name or os.path.basename(path), dumps
+
+
+def hashes(data):
+    """
+    Return the CRC32 and SHA-1 digest of a buffer, computed in one pass.
+
+    The buffer is hashed a step at a time, so a memory map is only paged in once. Python 3 hashes
+    it through a memoryview, without copying the steps.
+    """
+    crc = 0
+    sha1 = hashlib.sha1()
+    view = data
+    if sys.version[0] in '3':
+        view = memoryview(data)
+    try:
+        for start in range(0, len(data), STEP):
+            piece = view[start:start + STEP]
+            crc = zlib.crc32(piece, crc)
+            sha1.update(piece)
+    finally:
+        if hasattr(view, "release"):
+            view.release()
+    return crc & 0xffffffff, sha1.digest()
+
+
+def sizes(size):
+    """Return the sizes a file of the size given may have as a plain image."""
+    if size > dump.COPIER and (size - dump.COPIER) % dump.INTERLEAVE == 0:
+        return (size, size - dump.COPIER)
+    return (size, )
+
+
+class Index:
+    """
+    Index of the dumps listed by DAT files, stored in SQLite.
+
+    Attributes:
+        path -- string
+    Path of the index database.
+        sizes -- set
+    Sizes of every dump in the index, the prefilter of images to hash.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or location()
+        if self.path != ":memory:" and not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.db = sqlite3.connect(self.path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != VERSION:
+            self.db.execute("DROP TABLE IF EXISTS dats")
+            self.db.execute("DROP TABLE IF EXISTS dumps")
+            self.db.execute("PRAGMA user_version = %d" % VERSION)
+        self.db.execute("CREATE TABLE IF NOT EXISTS dats (id INTEGER PRIMARY KEY, "
+                        "path TEXT UNIQUE, size INTEGER, mtime REAL, name TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dumps (dat INTEGER, game TEXT, "
+                        "revision TEXT, name TEXT, size INTEGER, crc INTEGER, sha1 BLOB)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS dumps_crc ON dumps (crc)")
+        self.db.commit()
+        self.sizes = set([row[0] for row in self.db.execute("SELECT DISTINCT size FROM dumps")])
+
+    def add(self, path):
+        """
+        Add the dumps listed by a DAT file, unless already added and unchanged.
+
+        Keyword:
+            path -- string
+        Returns the number of dumps added, 0 for an unchanged DAT. A DAT changed since it was
+        added replaces its dumps.
+        """
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        row = self.db.execute("SELECT id, size, mtime FROM dats WHERE path = ?",
+                              (path, )).fetchone()
+        if row is not None and (row[1], row[2]) == (info.st_size, info.st_mtime):
+            return 0
+        name, rows = parse(path)
+        if row is not None:
+            self.remove(path)
+        cursor = self.db.execute("INSERT INTO dats (path, size, mtime, name) VALUES (?, ?, ?, ?)",
+                                 (path, info.st_size, info.st_mtime, name))
+        key = cursor.lastrowid
+        self.db.executemany("INSERT INTO dumps VALUES (%d, ?, ?, ?, ?, ?, ?)" % key, rows)
+        self.db.commit()
+        self.sizes.update([entry[3] for entry in rows])
+        return len(rows)
+
+    def remove(self, path=None):
+        """Remove the dumps of a DAT file, or of every DAT if no path is given."""
+        if path is None:
+            self.db.execute("DELETE FROM dumps")
+            self.db.execute("DELETE FROM dats")
+        else:
+            key = (os.path.abspath(path), )
+            self.db.execute("DELETE FROM dumps WHERE dat IN (SELECT id FROM dats WHERE path = ?)",
+                            key)
+            self.db.execute("DELETE FROM dats WHERE path = ?", key)
+        self.db.commit()
+        self.sizes = set([row[0] for row in self.db.execute("SELECT DISTINCT size FROM dumps")])
+
+    def lookup(self, size, crc, sha1=None):
+        """
+        Return the dump of the size and digests given, or None.
+
+        Keywords:
+            size -- integer
+            crc -- integer, the CRC32
+            sha1 -- bytes of the SHA-1 digest, or None
+        The dump is returned as a dict of its DAT name, game name, revision, file name, size,
+        CRC32, and SHA-1 as a hex string. Dumps without a SHA-1 in their DAT match on CRC32 and
+        size alone.
+        """
+        if size not in self.sizes:
+            return None
+        query = "SELECT dats.name, game, revision, dumps.name, dumps.size, crc, sha1 " \
+                "FROM dumps JOIN dats ON dumps.dat = dats.id WHERE crc = ? AND dumps.size = ?"
+        args = (crc, size)
+        if sha1 is not None:
+            query += " AND (sha1 IS NULL OR sha1 = ?)"
+            args += (sqlite3.Binary(sha1), )
+        row = self.db.execute(query + " ORDER BY sha1 IS NULL", args).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(("dat", "title", "revision", "name", "size", "crc"), row[:6]))
+        entry["sha1"] = row[6] is not None and binascii.hexlify(row[6]).decode("ascii") or None
+        return entry
+
+    def identify(self, path):
+        """
+        Return the dump an image file matches, or None.
+
+        Keyword:
+            path -- string
+        Only images of a size listed in the index are read. They are memory mapped where
+        possible, and hashed in one pass.
+        """
+        file = open(path, "rb")
+        try:
+            size = os.fstat(file.fileno()).st_size
+            kind = magic.detect(file)
+            if kind is not None:
+                # pylint: disable-next=import-outside-toplevel
+                from sg_tools import archive
+                size = archive.size(file, kind)
+            if not self.sizes.intersection(sizes(size)):
+                return None
+            if kind is not None:
+                image = archive.load(file, kind)
+            elif size:
+                image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                return None
+        finally:
+            file.close()
+        try:
+            plain = dump.normalize(image)[0]
+            size = len(plain)
+            if size not in self.sizes:
+                return None
+            crc, sha1 = hashes(plain)
+        finally:
+            if hasattr(image, "close"):
+                image.close()
+        return self.lookup(size, crc, sha1)
+
+    def usage(self):
+        """Return the name, path and number of dumps of every DAT in the index."""
+        return self.db.execute("SELECT name, path, (SELECT COUNT(*) FROM dumps "
+                               "WHERE dat = dats.id) FROM dats ORDER BY name").fetchall()
+
+    def close(self):
+        """Close the index database."""
+        self.db.close()
+
+
+def display(entry):
+    """Display the dump an image matched, or that it matched none."""
+    if entry is None:
+        print("DAT match: None")
+        return
+    print("DAT match: %s" % entry["dat"])
+    print("\tTitle: %s" % entry["title"])
+    print("\tRevision: %s" % (entry["revision"] or "Original"))
+    print("\tCRC32: %08x" % entry["crc"])
+
+
+def main():
+    """Run a command of the DAT index CLI, returning the exit status."""
+    if "-h" in sys.argv:
+        print(USAGE % sys.argv[0])
+        return 0
+    command = (sys.argv[1:] or ["info"])[0]
+    files = sys.argv[2:]
+    if command not in ("info", "add", "remove", "clear", "find") or \
+            (command in ("add", "remove", "find") and not files):
+        print(USAGE % sys.argv[0])
+        return 1
+    index = Index()
+    status = 0
+    for filename in files:
+        try:
+            if command == "add":
+                print("%s: %d dumps added" % (filename, index.add(filename)))
+            elif command == "remove":
+                index.remove(filename)
+            else:
+                print(filename)
+                display(index.identify(filename))
+        except (EnvironmentError, SyntaxError, ValueError):
+            print("%s: ERROR: %s" % (filename, sys.exc_info()[1]))
+            status = 1
+    if command == "clear":
+        index.remove()
+    if command != "find":
+        print(index.path)
+        for dat, path, count in index.usage():
+            print("\t%s: %d dumps (%s)" % (dat, count, path))
+    index.close()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
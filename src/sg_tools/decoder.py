@@ -3,11 +3,16 @@
 Decoder functions for romheader module.
 
 Some segments are validated. If a segment of data appears invalid, ValidationError is raised.
+
+There are two backends, picked at import. Python 3 decodes bytes, memoryview, and tuple segments
+directly with the bytes-native backend. Older versions, or any version with the environment
+variable SG_TOOLS_DECODER set to "tuple", decode tuples of bytes through hex strings.
 """
 
+import os
 import struct
 import sys
-from struct import pack
+from struct import pack, unpack
 
 if sys.version[0] in '3':
     # pylint: disable-next=invalid-name
@@ -32,23 +37,30 @@ def decode(option, segment):
         option -- string
         segment -- raw tuple of bytes
     """
-    functions = {"ascii": string, "checksum": raw, "device": peripheral, "modem": modem,
-                 "range": alloc, "extra": sram, "region": locale, "prod": raw_be,
-                 "version": nibble_lsb, "m3region": m3locale, "size": sizes}
-
-    if option in ["system", "copyright", "domestic", "export", "serial"]:
-        option = "ascii"
-    if option in ["romrange", "ramrange"]:
-        option = "range"
-    result = functions[option](segment)
-
-    if option in "ascii":
+    result = DECODERS[option](segment)
+    if option in ASCII:
         if not isinstance(result, (str, unicode)):
             raise ValidationError()
     return result
 
 
 # Data manipulation
+def view(data, length=None):
+    """
+    Return a sliceable view of raw image data for the decoder functions.
+
+    Keywords:
+        data -- string of bytes, mmap, or other buffer
+        length -- integer, or None for all of the data
+    Python 3 gets a zero-copy memoryview, so slicing a header window does not copy the image.
+    Older versions get the tuple of bytes the decoder functions were written for.
+    """
+    if sys.version[0] in '3':
+        return memoryview(data)[:length]
+    data = data[:length]
+    return unpack("B"*len(data), data)
+
+
 def join(mid, end):
     """
     Join hex value parts to create an offset value.
@@ -135,31 +147,85 @@ def integer(word):
 
 
 # Scanning
+def octets(segment):
+    """Return the raw data segment as a string of bytes."""
+    return pack("B"*len(segment), *segment)
+
+
+def register(name, mode, section, probes, confidence):
+    """
+    Add a platform signature to the registry scanned for image types.
+
+    Keywords:
+        name -- string
+        mode -- string, the image type, md, sms, cd, or sg
+        section -- string, the header format of 8-bit images, or None
+        probes -- tuple of (start, end, pattern) tuples
+        confidence -- number, from 0 to 1
+    A signature matches when every pattern is found between its start and end offsets, exactly
+    at the start if the span is the length of the pattern. The registry is kept in order of
+    confidence, then of registration, so the first match is the most likely.
+    """
+    if sys.version[0] in '3':
+        probes = tuple([(start, end, pattern.encode("latin-1")) for start, end, pattern in probes])
+    index = len(SIGNATURES)
+    while index and SIGNATURES[index - 1][0] > -confidence:
+        index -= 1
+    SIGNATURES.insert(index, (-confidence, name, mode, section, probes))
+
+
+def probe(data, option=''):
+    """
+    Yield every image type a buffer matches, most likely first.
+
+    Keywords:
+        data -- tuple of bytes, or buffer
+        option -- string, limiting the image types to those of a run mode
+    Each match is a tuple of the confidence, image type, header section, and signature name,
+    with only the most likely of each image type and section. Every window is sliced once and
+    compared as bytes, however many signatures probe it.
+    """
+    windows = {}
+    found = {}
+    for rank, name, mode, section, probes in SIGNATURES:
+        if option not in mode or (mode, section) in found:
+            continue
+        for start, end, pattern in probes:
+            window = windows.get((start, end))
+            if window is None:
+                window = windows[start, end] = octets(data[start:end])
+            if window.find(pattern) < 0:
+                break
+        else:
+            found[mode, section] = True
+            yield -rank, mode, section, name
+
+
+def candidates(data, option=''):
+    """Return every image type a buffer matches, most likely first. See probe()."""
+    return list(probe(data, option))
+
+
 def scan(data, option=''):
     """
-    Determine the type of image by scanning different offsets of file.
+    Determine the type of image by probing the offsets of every platform signature.
 
     Keywords:
-        data -- tuple of bytes
+        data -- tuple of bytes, or buffer
+        option -- string, limiting the image types to those of a run mode
+    Returns the image type and header section of the most likely candidate, probing no further
+    than the signature it matches.
     """
-    if option in "md" or not option:
-        if "SEGA" in str(string(data[0x100:0x110])):
-            return "md", None
-    if option in "sms" or not option:
-        try:
-            if "SEGA" in str(string(data[0x7ff0:0x7ff8])):
-                return "sms", "7f"
-        except UnicodeEncodeError:
-            pass
-        try:
-            if "SEGA" in str(string(data[0x81f0:0x81f8])):
-                return "sms", "81"
-        except UnicodeEncodeError:
-            # pylint: disable-next=raise-missing-from
-            raise ValidationError()
+    for match in probe(data, option):
+        return match[1], match[2]
     raise ValidationError()
 
 
+def origin(section):
+    """Return the offset of the header of an 8-bit image, from its header section."""
+    return ORIGINS.get(section) or join(section, "f0")
+
+
 def lookup(table, segment):
     """Perform a table lookup of a data segment and return all matches."""
     matches = []
@@ -254,3 +320,101 @@ def m3locale(segment):
     regions = {"3": "SMS Japan", "4": "SMS Export", "5": "Game Gear Japan",
                "6": "Game Gear Export", "7": "Game Gear International"}
     return regions[nibble_msb(segment)]
+
+
+# Bytes-native backend
+# pylint: disable-next=invalid-name
+BACKEND = "tuple"
+if sys.version[0] in '3' and os.environ.get("SG_TOOLS_DECODER") != "tuple":
+    # pylint: disable-next=invalid-name
+    BACKEND = "bytes"
+    HEXDIGITS = "0123456789abcdef"
+
+    # pylint: disable-next=function-redefined
+    def nibble_lsb(byte):
+        """Return the least significant nibble of a byte in a segment."""
+        return HEXDIGITS[byte[0] & 0xf]
+
+    # pylint: disable-next=function-redefined
+    def nibble_msb(byte):
+        """Return the most significant nibble of a byte in a segment."""
+        return HEXDIGITS[byte[0] >> 4]
+
+    # pylint: disable-next=function-redefined
+    def raw(segment):
+        """Return the raw hex value of the raw data segment."""
+        return bytes(segment).hex()
+
+    # pylint: disable-next=function-redefined
+    def raw_be(segment):
+        """Return the raw hex value of the raw data segment, in big-endian order."""
+        segment = bytes(segment)
+        code = HEXDIGITS[segment[-1] >> 4] + segment[-2::-1].hex()
+        if code[0] == "0":
+            code = code[1:]
+        return code
+
+    # pylint: disable-next=function-redefined
+    def string(segment):
+        """Return the CP-932 decoded string value of the raw data segment, or its raw bytes."""
+        try:
+            segment = bytes(segment)
+        except (TypeError, ValueError):
+            print("FATAL: Byte array tuple required")
+            return None
+        try:
+            return segment.decode("cp932")
+        except (UnicodeDecodeError, LookupError):
+            return segment
+
+    # pylint: disable-next=function-redefined
+    def octets(segment):
+        """Return the raw data segment as bytes."""
+        return bytes(segment)
+
+    # pylint: disable-next=function-redefined
+    def integer(word):
+        """Return the integer of a raw big-endian word."""
+        if not word:
+            raise ValueError("Empty word")
+        return int.from_bytes(bytes(word), "big")
+
+
+# 8-bit homebrew specific
+def bcd(segment):
+    """Return the version of a binary-coded decimal major and minor pair."""
+    return "%x.%02x" % (segment[0], segment[1])
+
+
+def bcdate(segment):
+    """Return the date of a binary-coded decimal day, month, and little-endian year."""
+    return "%02x%02x-%02x-%02x" % (segment[3], segment[2], segment[1], segment[0])
+
+
+# Decoder of each header field, bound once at import
+DECODERS = {"ascii": string, "system": string, "copyright": string, "domestic": string,
+            "export": string, "serial": string, "checksum": raw, "device": peripheral,
+            "modem": modem, "range": alloc, "romrange": alloc, "ramrange": alloc, "extra": sram,
+            "region": locale, "prod": raw_be, "version": nibble_lsb, "m3region": m3locale,
+            "size": sizes, "disc": string, "volume": string, "sysname": string, "date": string,
+            "sdscversion": bcd, "sdscdate": bcdate, "entry": raw}
+ASCII = {"ascii": 1, "system": 1, "copyright": 1, "domestic": 1, "export": 1, "serial": 1,
+         "disc": 1, "volume": 1, "sysname": 1, "date": 1}
+
+# Header offset of 8-bit header sections not named after their offset
+ORIGINS = {"sdsc": 0x7ff0}
+# Platform signatures, by confidence, then in order of preference between equally likely ones
+SIGNATURES = []
+register("cd", "cd", None, ((0x0, 0xe, "SEGADISCSYSTEM"), ), 1.0)
+register("md", "md", None, ((0x100, 0x104, "SEGA"), ), 0.95)
+register("md-loose", "md", None, ((0x100, 0x110, "SEGA"), ), 0.7)
+register("sdsc", "sms", "sdsc", ((0x7fe0, 0x7fe4, "SDSC"), (0x7ff0, 0x7ff8, "TMR SEGA")), 0.95)
+register("sms", "sms", "7f", ((0x7ff0, 0x7ff8, "TMR SEGA"), ), 0.9)
+register("sms-copier", "sms", "81", ((0x81f0, 0x81f8, "TMR SEGA"), ), 0.85)
+register("sms-16k", "sms", "3f", ((0x3ff0, 0x3ff8, "TMR SEGA"), ), 0.8)
+register("sms-8k", "sms", "1f", ((0x1ff0, 0x1ff8, "TMR SEGA"), ), 0.8)
+register("sms-loose", "sms", "7f", ((0x7ff0, 0x7ff8, "SEGA"), ), 0.6)
+register("sms-copier-loose", "sms", "81", ((0x81f0, 0x81f8, "SEGA"), ), 0.55)
+# SG-1000 images have no header, only the usual Z80 start up code: di, then im 1 or ld sp
+register("sg", "sg", None, ((0x0, 0x3, "\xf3\xed\x56"), ), 0.3)
+register("sg-stack", "sg", None, ((0x0, 0x2, "\xf3\x31"), ), 0.2)
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+"""
+Locating the header of Sega CD/Mega CD disc images.
+
+The header of a disc is in the first sector of its first track, a system ID area starting with
+SEGADISCSYSTEM, followed at 0x100 by the same fields as a cartridge header. Disc images come as:
+
+ISO
+    2048 bytes of user data per sector, so the header is at the start of the file.
+Raw BIN
+    2352-byte sectors, each with a 16-byte sync and sector header before its user data (24 bytes
+    for mode 2), listed by a CUE sheet with the first track possibly at an offset into the file.
+
+Only the header is read, by seeking straight to it, so the header of a whole disc costs one read
+of a few kilobytes.
+"""
+
+import os
+import re
+import sys
+
+DISC = "SEGADISCSYSTEM".encode()
+# Size of the header, from the system ID area to the end of the cartridge style fields
+HEADER = 0x200
+# Offset of the user data in a raw sector, by track mode
+USER = {"MODE1/2048": 0, "MODE1/2352": 16, "MODE2/2336": 8, "MODE2/2352": 24}
+SECTORS = {"MODE1/2048": 2048, "MODE1/2352": 2352, "MODE2/2336": 2336, "MODE2/2352": 2352}
+# Frames per second of CUE sheet timestamps
+FRAMES = 75
+FILE = re.compile(r'^\s*FILE\s+(?:"([^"]+)"|(\S+))', re.I)
+TRACK = re.compile(r"^\s*TRACK\s+(\d+)\s+(\S+)", re.I)
+INDEX = re.compile(r"^\s*INDEX\s+01\s+(\d+):(\d+):(\d+)", re.I)
+
+
+def locate(data):
+    """
+    Return the offset of the header of a disc image in the buffer given, or None.
+
+    Keyword:
+        data -- buffer of the start of an ISO or raw BIN image
+    """
+    for offset in (0, 16, 24):
+        if data[offset:offset + len(DISC)] == DISC:
+            return offset
+    return None
+
+
+def track(path):
+    """
+    Return the data file, and the offset of the header in it, of the first track of a CUE sheet.
+
+    Keyword:
+        path -- string
+    CUE sheets have no set encoding, so the sheet is read as bytes, and file names in it are taken
+    byte for byte, whatever encoding they were written in. Raises IOError if the CUE sheet lists
+    no data track.
+    """
+    cue = open(path, "rb")
+    try:
+        sheet = cue.read()
+    finally:
+        cue.close()
+    if sys.version[0] in '3':
+        sheet = sheet.decode("latin-1")
+    data = mode = None
+    for line in sheet.splitlines():
+        match = FILE.match(line)
+        if match:
+            data = match.group(1) or match.group(2)
+            if sys.version[0] in '3':
+                data = os.fsdecode(data.encode("latin-1"))
+            continue
+        match = TRACK.match(line)
+        if match:
+            mode = match.group(2).upper()
+            continue
+        match = INDEX.match(line)
+        if match and data is not None and mode in USER:
+            minutes, seconds, frames = [int(part) for part in match.groups()]
+            sector = (minutes * 60 + seconds) * FRAMES + frames
+            return (os.path.join(os.path.dirname(path), data),
+                    sector * SECTORS[mode] + USER[mode])
+    raise IOError("No data track in CUE sheet")
+
+
+def read(path):
+    """
+    Return the header of a disc image, seeking straight to it.
+
+    Keyword:
+        path -- string, a CUE sheet, or an ISO or raw BIN image
+    Raises IOError if no disc header is found.
+    """
+    start = 0
+    if path.lower().endswith(".cue"):
+        path, start = track(path)
+    file = open(path, "rb")
+    try:
+        file.seek(start)
+        data = file.read(HEADER + 24)
+    finally:
+        file.close()
+    offset = locate(data)
+    if offset is None:
+        raise IOError("No Sega CD header in %s" % path)
+    return data[offset:offset + HEADER]
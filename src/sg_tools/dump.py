@@ -0,0 +1,143 @@
+#!/usr/bin/python
+"""
+Detection and conversion of 16-bit image dump layouts.
+
+Besides plain binary images, two other layouts of Genesis/Mega Drive dumps are common:
+
+Interleaved (.smd)
+    A 512-byte copier header, then 16KB blocks, each holding the 8KB of odd bytes of that part of
+    the image followed by its 8KB of even bytes.
+Byte-swapped
+    A plain image with the two bytes of every 16-bit word swapped, so "SEGA" reads "ESAG".
+
+Both are recognized from the header windows, by reading the bytes that would hold "SEGA" in
+place, and converted to plain images a whole block or the whole image at a time. Images are
+converted with NumPy when available, and small buffers, such as the header windows, with slice
+assignment. NumPy is only imported once a whole image needs converting, so reading headers, or
+plain images, does not load it.
+
+Layouts are detected on any Python version, and converted on Python 2.6+, for bytearray.
+"""
+
+# NumPy module once imported, False if unavailable, or None until first needed
+NUMPY = None
+
+# Size of the copier header of interleaved images
+COPIER = 512
+# Size of an interleaved block, half odd bytes then half even bytes
+INTERLEAVE = 0x4000
+# Largest buffer converted by slice assignment even with NumPy, covering the header windows
+SMALL = 0x10000
+LAYOUTS = {"smd": "Interleaved SMD", "swapped": "Byte-swapped"}
+SEGA = "SEGA".encode()
+SWAPPED = "ESAG".encode()
+
+
+def detect(data):
+    """
+    Return the layout of an image, smd or swapped, or None for a plain image.
+
+    Keyword:
+        data -- buffer of the image, or of at least its header windows
+    An image is interleaved if its first block holds the 16-bit header: the even bytes of
+    "SEGA" in its half of even bytes, and the odd ones in its half of odd bytes.
+    """
+    if data[0x100:0x104] == SEGA:
+        return None
+    if data[0x100:0x104] == SWAPPED:
+        return "swapped"
+    if len(data) >= COPIER + INTERLEAVE:
+        even = COPIER + INTERLEAVE // 2 + 0x100 // 2
+        odd = COPIER + 0x100 // 2
+        if data[even:even + 2] == SEGA[0::2] and data[odd:odd + 2] == SEGA[1::2]:
+            return "smd"
+    return None
+
+
+def accelerator():
+    """Return the NumPy module, or None if unavailable, importing it when first needed."""
+    # pylint: disable-next=global-statement
+    global NUMPY
+    if NUMPY is None:
+        try:
+            # pylint: disable-next=import-outside-toplevel
+            import numpy
+            NUMPY = numpy
+        except ImportError:
+            NUMPY = False
+    return NUMPY or None
+
+
+def deinterleave(data):
+    """
+    Return an interleaved image as a plain image.
+
+    The copier header and any trailing partial block are dropped.
+    """
+    blocks = (len(data) - COPIER) // INTERLEAVE
+    plain = bytearray(blocks * INTERLEAVE)
+    half = INTERLEAVE // 2
+    numpy = None
+    if len(data) > SMALL:
+        numpy = accelerator()
+    if numpy is not None:
+        source = numpy.frombuffer(data, numpy.uint8, blocks * INTERLEAVE, COPIER)
+        source = source.reshape(blocks, 2, half)
+        target = numpy.frombuffer(plain, numpy.uint8).reshape(blocks, half, 2)
+        target[:, :, 0] = source[:, 1]
+        target[:, :, 1] = source[:, 0]
+        return plain
+    for block in range(blocks):
+        start = COPIER + block * INTERLEAVE
+        offset = block * INTERLEAVE
+        plain[offset:offset + INTERLEAVE:2] = data[start + half:start + INTERLEAVE]
+        plain[offset + 1:offset + INTERLEAVE:2] = data[start:start + half]
+    return plain
+
+
+def byteswap(data):
+    """Return a byte-swapped image as a plain image. An odd trailing byte is kept as is."""
+    plain = bytearray(len(data))
+    even = len(data) & ~1
+    plain[even:] = data[even:]
+    numpy = None
+    if len(data) > SMALL:
+        numpy = accelerator()
+    if numpy is not None:
+        source = numpy.frombuffer(data, numpy.uint8, even)
+        target = numpy.frombuffer(plain, numpy.uint8, even)
+        target[0::2] = source[1::2]
+        target[1::2] = source[0::2]
+        return plain
+    plain[0:even:2] = data[1:even:2]
+    plain[1:even:2] = data[0:even:2]
+    return plain
+
+
+def normalize(data, layout=None):
+    """
+    Return an image as a plain image, and its original layout.
+
+    Keywords:
+        data -- buffer of the image
+        layout -- string, smd or swapped, or None to detect it
+    Plain images are returned as given, without a copy.
+    """
+    layout = layout or detect(data)
+    if layout == "smd":
+        return deinterleave(data), layout
+    if layout == "swapped":
+        return byteswap(data), layout
+    return data, None
+
+
+def window(data):
+    """
+    Return the header windows of an image as those of a plain image, and its original layout.
+
+    Only the first block of an interleaved image, holding the 16-bit header, is converted.
+    """
+    layout = detect(data)
+    if layout == "smd":
+        return deinterleave(data[:COPIER + INTERLEAVE]), layout
+    return normalize(data, layout)
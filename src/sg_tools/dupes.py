@@ -0,0 +1,314 @@
+#!/usr/bin/python
+"""
+Finding duplicate and overdumped images in a library.
+
+Images are compared in stages, each reading more of fewer images, so that only images that
+could still be duplicates of each other are read any further:
+
+1. File size, from a stat() of every image.
+2. Header, decoded from the header windows: type, serial and checksum.
+3. Hashes of the first and last blocks.
+4. Hash of the whole image, across a process pool.
+
+Images are compared as stored, so the same image in and out of an archive is not a duplicate.
+
+Overdumps hold their image more than once, in halves that mirror each other. The start of each
+half is compared first, and only images whose halves start the same are compared in full.
+
+Requires Python 2.6+, and 3.2+ or the futures backport for the process pool.
+"""
+
+import hashlib
+import mmap
+import os
+import sys
+
+from sg_tools import batch
+
+USAGE = """Usage: %s [options] path...
+Find duplicate and overdumped images among files and directories
+Options:
+    -j  Number of hashing processes
+    -o  Skip looking for overdumps
+
+    -h  Print this help message
+
+Example on Ubuntu:
+    %s -j 4 /path/to/roms"""
+
+# Bytes hashed at each end of an image before hashing it whole
+BLOCK = 64 * 1024
+# Smallest image whose halves are compared for an overdump
+MIRROR = 2 * 0x2000
+# Bytes hashed or compared per step
+STEP = 1024 * 1024
+
+
+def abort(message, level=1):
+    """Print a message to screen and quit module."""
+    print(message)
+    if __name__ == "__main__":
+        raise SystemExit(level)
+
+
+def sizes(paths):
+    """Return the file images found among files and directories, grouped by size."""
+    groups = {}
+    for path in batch.walk(paths):
+        try:
+            size = os.stat(path).st_size
+        except EnvironmentError:
+            continue
+        if size:
+            groups.setdefault(size, []).append(path)
+    return groups
+
+
+def signature(path):
+    """Return the type, serial and checksum of the header of an image, or None if invalid."""
+    keys = batch.decode(path, batch.prefetch(path))[1]
+    if keys is None:
+        return None
+    values = keys.record()
+    return keys.mode, values.get("serial"), values.get("checksum")
+
+
+def ends(path):
+    """Return the SHA-1 digest of the first and last blocks of an image."""
+    file = open(path, "rb")
+    try:
+        sha1 = hashlib.sha1(file.read(BLOCK))
+        size = os.fstat(file.fileno()).st_size
+        if size > BLOCK:
+            file.seek(max(size - BLOCK, BLOCK))
+            sha1.update(file.read(BLOCK))
+        return sha1.hexdigest()
+    finally:
+        file.close()
+
+
+def window(data):
+    """Return a memory map to slice, as a memoryview where supported, so steps are not copied."""
+    if sys.version[0] in '3':
+        return memoryview(data)
+    return data
+
+
+def digest(path):
+    """Return the SHA-1 digest of a whole image, hashed over a memory map."""
+    file = open(path, "rb")
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        file.close()
+    sha1 = hashlib.sha1()
+    view = window(data)
+    try:
+        for start in range(0, len(data), STEP):
+            sha1.update(view[start:start + STEP])
+    finally:
+        if hasattr(view, "release"):
+            view.release()
+        data.close()
+    return sha1.hexdigest()
+
+
+def halves(path):
+    """Return whether the halves of an image start the same, reading a block of each."""
+    file = open(path, "rb")
+    try:
+        size = os.fstat(file.fileno()).st_size
+        if size < MIRROR or size % 2:
+            return False
+        first = file.read(min(BLOCK, size // 2))
+        file.seek(size // 2)
+        return file.read(len(first)) == first
+    finally:
+        file.close()
+
+
+def mirrored(path):
+    """
+    Return the number of copies of its image an overdump holds, 1 if not an overdump.
+
+    The halves of the image are compared a step at a time, then the halves of its first half,
+    and so on while they mirror each other.
+    """
+    file = open(path, "rb")
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        file.close()
+    view = window(data)
+    try:
+        size = len(data)
+        copies = 1
+        while size >= MIRROR and size % 2 == 0:
+            half = size // 2
+            for start in range(0, half, STEP):
+                end = min(start + STEP, half)
+                if view[start:end] != view[half + start:half + end]:
+                    return copies
+            size = half
+            copies *= 2
+        return copies
+    finally:
+        if hasattr(view, "release"):
+            view.release()
+        data.close()
+
+
+def refine(groups, key):
+    """
+    Split groups of images on a key function, keeping groups that still have several images.
+
+    Images the key cannot be computed for, such as ones removed since, are dropped.
+    """
+    refined = []
+    for group in groups:
+        split = {}
+        for path in group:
+            try:
+                value = key(path)
+            except EnvironmentError:
+                continue
+            split.setdefault(value, []).append(path)
+        refined.extend([paths for paths in split.values() if len(paths) > 1])
+    return refined
+
+
+def pool(function, paths, jobs=None):
+    """
+    Return the results of a function over many images, computed across a process pool.
+
+    With one job, or without concurrent.futures, they are computed one at a time in this
+    process. Images the function fails on get None.
+    """
+    try:
+        # pylint: disable-next=import-outside-toplevel
+        from concurrent import futures
+    except ImportError:
+        jobs = 1
+    if jobs == 1 or len(paths) < 2:
+        results = []
+        for path in paths:
+            try:
+                results.append(function(path))
+            except EnvironmentError:
+                results.append(None)
+        return results
+    executor = futures.ProcessPoolExecutor(jobs)
+    try:
+        tasks = [executor.submit(function, path) for path in paths]
+        results = []
+        for task in tasks:
+            try:
+                results.append(task.result())
+            except EnvironmentError:
+                results.append(None)
+        return results
+    finally:
+        executor.shutdown()
+
+
+def duplicates(paths, jobs=None, stats=None):
+    """
+    Find groups of byte-identical images.
+
+    Keywords:
+        paths -- list of file and directory paths
+        jobs -- number of hashing processes, or None for one per CPU
+        stats -- dict counting the images left after each stage, or None
+    Returns a list of the SHA-1 digest, size and paths of every group of duplicates, largest
+    images first. The images hashed in full are counted in stats as well.
+    """
+    if stats is None:
+        stats = {}
+    found = sizes(paths)
+    stats["files"] = sum([len(group) for group in found.values()])
+    groups = [group for group in found.values() if len(group) > 1]
+    stats["size"] = sum([len(group) for group in groups])
+    groups = refine(groups, signature)
+    stats["header"] = sum([len(group) for group in groups])
+    groups = refine(groups, ends)
+    stats["ends"] = sum([len(group) for group in groups])
+    survivors = [path for group in groups for path in group]
+    digests = dict(zip(survivors, pool(digest, survivors, jobs)))
+    stats["hashed"] = len([sha1 for sha1 in digests.values() if sha1 is not None])
+    groups = refine(groups, digests.get)
+    results = []
+    for group in groups:
+        sha1 = digests[group[0]]
+        if sha1 is not None:
+            results.append((sha1, os.path.getsize(group[0]), sorted(group)))
+    results.sort(key=lambda result: (-result[1], result[2]))
+    return results
+
+
+def overdumps(paths, jobs=None):
+    """
+    Find overdumped images.
+
+    Keywords:
+        paths -- list of file and directory paths
+        jobs -- number of comparing processes, or None for one per CPU
+    Returns a list of the path, number of copies, and size of a copy of every overdump.
+    """
+    suspects = []
+    for path in batch.walk(paths):
+        try:
+            if halves(path):
+                suspects.append(path)
+        except EnvironmentError:
+            continue
+    results = []
+    for path, copies in zip(suspects, pool(mirrored, suspects, jobs)):
+        if copies and copies > 1:
+            results.append((path, copies, os.path.getsize(path) // copies))
+    return results
+
+
+def parse_options():
+    """Parse arguments from command line."""
+    if "-h" in sys.argv:
+        abort(USAGE % (sys.argv[0], sys.argv[0]), 0)
+    options = {"paths": []}
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg == "-o":
+            options[arg] = True
+        elif arg == "-j":
+            options[arg] = next(args, None)
+        else:
+            options["paths"].append(arg)
+    if not options["paths"]:
+        abort("No path")
+    return options
+
+
+def main(options):
+    """Find and list duplicates and overdumps, returning the exit status."""
+    try:
+        workers = int(options.get("-j", 0)) or None
+    except ValueError:
+        print("ERROR: Invalid options entered")
+        return 1
+    counts = {}
+    groups = duplicates(options["paths"], workers, counts)
+    for sha1, size, group in groups:
+        print("Duplicates: %d bytes, SHA-1 %s" % (size, sha1))
+        for path in group:
+            print("\t%s" % path)
+    mirrors = []
+    if "-o" not in options:
+        mirrors = overdumps(options["paths"], workers)
+    for path, copies, size in mirrors:
+        print("Overdump: %s, %d copies of %d bytes" % (path, copies, size))
+    print("%d files, %d left after sizes, %d after headers, %d after ends, %d hashed in full"
+          % (counts["files"], counts["size"], counts["header"], counts["ends"], counts["hashed"]))
+    print("%d groups of duplicates, %d overdumps" % (len(groups), len(mirrors)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(parse_options()))
@@ -7,18 +7,20 @@ Golang can, particularly, with older devices.
 
 Tested working on Python 2.3.5+ with pyserial 2.7+
 Python 2.6+ required for autoscanning of USB port
+
+pyserial and the header decoders are imported when first needed, so the help and option errors
+come up without loading either.
 """
 
+import mmap
+import os
+import select
 import sys
-from struct import pack, unpack
+from struct import calcsize, pack, unpack
 from sys import argv
-from time import sleep
-
-import serial
+from time import sleep, time
 
-from sg_tools import decoder
-from sg_tools.decoder import ValidationError
-from sg_tools.header import Header
+from sg_tools import instrument, magic
 
 if sys.version[0] in '2':
     # pylint: disable-next=redefined-builtin, invalid-name
@@ -31,6 +33,12 @@ Options:
     -b  Baud rate (bps)
     -t  Serial read timeout (s)
     -m  Everdrive run mode (cd, m10, md, os, sms, or ssf)
+    -c  Use the header cache
+    -k  Transfer chunk size (64KB blocks)
+    -w  Seconds to wait for the Everdrive to be plugged in, when scanning
+    -a  Send to every Everdrive found at once, or to every port listed in -p, comma separated
+    --watch  Send and run the file again each time it is rebuilt, until interrupted
+    --profile[=file]  Report the time and memory of each stage, and write a cProfile dump to file
 
     -h  Print this help message
 
@@ -39,6 +47,20 @@ Example using all the options on Ubuntu:
 
 BLOCK = 512 * 128
 MAXROM = 0xf00000
+CHUNK = BLOCK
+WRITE_TIMEOUT = 120
+# Share of the transfer time added to the read timeout when waiting for the transfer ack
+ACK_SLACK = 0.5
+# USB vendor and product IDs of the FTDI chips used by Everdrives
+USB_IDS = ((0x0403, 0x6001), (0x0403, 0x6015))
+# Read timeout of the handshake probing a port, in seconds
+PROBE_TIMEOUT = 0.5
+# Seconds between port listings while waiting for the Everdrive to be plugged in
+HOTPLUG_POLL = 0.5
+# Seconds between checks of a watched image without inotify
+POLL = 0.5
+# Seconds a watched image must stay unchanged before it is sent
+DEBOUNCE = 0.3
 
 
 class Loader:
@@ -64,6 +86,17 @@ class Loader:
     Optional read timeout settings for Everdrive connection. Default is 1.
         run_mode -- string
     Mode for launching the image file. Default is Mega Drive/Genesis
+        cache -- object
+    Header cache consulted before decoding the image header, or None. True uses the default
+    cache.
+        chunk -- integer
+    Size of each write of the image transfer, a multiple of the block size.
+        progress -- function
+    Called after each chunk of the image transfer, or None. See Link.transfer.
+        wait -- number
+    Seconds to wait for the Everdrive to be plugged in when scanning. Default is 0.
+        probed -- object
+    Link opened and tested by the scan, used by the next connect, or None.
     """
 
     def __init__(self, filepath=None, port=None, cxn=(9600, 1, ), mode="md", **kwargs):
@@ -75,6 +108,15 @@ class Loader:
         self.serial_port = kwargs.pop("-p", port)
         self.cxn = (kwargs.pop("-b", cxn[0]), kwargs.pop("-t", cxn[1]), )
         self.run_mode = kwargs.pop("-m", mode)
+        self.cache = kwargs.pop("-c", kwargs.pop("cache", None))
+        if self.cache is True:
+            # pylint: disable-next=import-outside-toplevel
+            from sg_tools.cache import Cache
+            self.cache = Cache()
+        self.chunk = int(kwargs.pop("-k", 0)) * BLOCK or kwargs.pop("chunk", CHUNK)
+        self.progress = kwargs.pop("progress", None)
+        self.wait = float(kwargs.pop("-w", kwargs.pop("wait", 0)))
+        self.probed = None
         if not self.serial_port or self.serial_port == "None":
             if sys.version[0] in '2' and int(sys.version[2]) < 6:
                 abort("ERROR: No port path entered.\n%s" % USAGE % (argv[0], argv[0]))
@@ -82,32 +124,41 @@ class Loader:
             self.scan()
 
     def scan(self):
-        """Scan for first available FTDI device to use."""
-        # pylint: disable-next=import-outside-toplevel
-        from serial.tools import list_ports
-        ports = list_ports.comports(include_links=True)
-        for port in ports:
-            if port.manufacturer == "FTDI":
-                self.serial_port = port.device
-                print("Found serial port: %s" % port.device)
-                break
-        if not self.serial_port:
+        """
+        Find the port of an Everdrive.
+
+        The port an Everdrive last answered on is tried first, with a single handshake. Otherwise
+        ports with the USB IDs of an FTDI chip are probed concurrently, until one answers or the
+        wait for the Everdrive to be plugged in times out.
+        """
+        mark = instrument.begin("discover")
+        self.probed = discover(self.cxn[0], self.cxn[1], self.wait)
+        instrument.end(mark)
+        if self.probed is None:
             abort("ERROR: No compatible serial port found.")
+            return
+        self.serial_port = self.probed.port
+        print("Found serial port: %s" % self.serial_port)
 
     def connect(self):
         """Create a link, initiate, and test connection."""
+        self.link, self.probed = self.probed, None
+        if self.link is not None:
+            self.error = None
+            return
         self.link = Link(self.serial_port, self.cxn[0], self.cxn[1])
-        self.link.setup()
-        self.error = self.link.test()
+        self.error = self.link.setup() or self.link.test()
+        if not self.error:
+            remember(self.serial_port)
 
     def load(self):
         """Load file image to application."""
-        self.parser = Parser(self.file)
+        self.parser = Parser(self.file, self.cache)
         self.parser.ident(self.run_mode)
 
     def send(self):
         """Send loaded image to Everdrive link."""
-        self.error = self.link.transfer(self.parser.raw)
+        self.error = self.link.transfer(self.parser.image, self.chunk, self.progress)
 
     def run(self):
         """Launch image, using specified run mode of application."""
@@ -127,6 +178,120 @@ class Loader:
         if not self.error:
             self.run()
 
+    def watch(self, interval=POLL, debounce=DEBOUNCE):
+        """
+        Send and run the image again each time it is rewritten, until interrupted.
+
+        Keywords:
+            interval -- seconds between checks when polling
+            debounce -- seconds the image must stay unchanged after a write
+        The link is kept open between sends, and reopened if a send failed.
+        """
+        watcher = Watcher(self.file, interval)
+        print("Watching %s for changes..." % self.file)
+        try:
+            while True:
+                watcher.wait()
+                if not watcher.settle(debounce):
+                    continue
+                print("Image changed, sending again...")
+                self.load()
+                if self.error or self.link is None or self.link.cxn is None:
+                    self.error = None
+                    self.connect()
+                self.start()
+        finally:
+            watcher.close()
+
+
+class Image:
+    """
+    Read-only buffer of an image, padded with 0s to the nearest block size.
+
+    The padding is virtual. It is produced separately when the image is read, so the image is
+    never copied to be padded.
+
+    Attributes:
+        data -- object
+    Memory map, or string of bytes, of the image
+        size -- integer
+    Size of the image, in bytes
+        pad -- integer
+    Number of 0s padding the image to the nearest block size
+    """
+
+    def __init__(self, data):
+        if isinstance(data, tuple):
+            data = pack("B"*len(data), *data)
+        self.data = data
+        self.size = len(data)
+        self.pad = -self.size % BLOCK
+
+    def __len__(self):
+        return self.size + self.pad
+
+    def blocks(self):
+        """Return the size of the padded image in block units."""
+        return len(self) // BLOCK
+
+    def view(self):
+        """Return the image without padding, as a memoryview where supported."""
+        if sys.version[0] in '3':
+            return memoryview(self.data)
+        return self.data[:]
+
+    def padding(self):
+        """Return the 0s padding the image."""
+        return pack("%dx" % self.pad)
+
+    def chunks(self, size):
+        """
+        Yield the padded image in pieces of at most the size given.
+
+        Pieces of the image are slices of its view, and are not copied. The padding follows as
+        its own piece.
+        """
+        data = self.view()
+        for offset in range(0, self.size, size):
+            yield data[offset:offset + size]
+        if self.pad:
+            yield self.padding()
+
+
+class Meter:
+    """
+    Throughput of a transfer, measured chunk by chunk.
+
+    Attributes:
+        total -- integer
+    Bytes to send
+        sent -- integer
+    Bytes sent so far
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.start = self.last = time()
+
+    def update(self, size):
+        """
+        Count a chunk sent, returning the arguments of a progress callback.
+
+        These are the bytes sent, the total bytes, the throughput of the chunk and the average
+        throughput in bytes per second, and the estimated seconds left.
+        """
+        now = time()
+        self.sent += size
+        rate = size / max(now - self.last, 1e-6)
+        average = self.sent / max(now - self.start, 1e-6)
+        self.last = now
+        return self.sent, self.total, rate, average, (self.total - self.sent) / average
+
+    def rate(self):
+        """Return the average throughput so far, in bytes per second."""
+        return self.sent / max(time() - self.start, 1e-6)
+
 
 class Parser:
     """
@@ -137,57 +302,213 @@ class Parser:
     Filepath of image being accessed
         header -- object
     Header of the loaded image, if valid
+        cache -- object
+    Header cache consulted before decoding, or None
+        image -- object
+    Image buffer, padded to the nearest block size
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, cache=None):
         self.header = None
+        self.image = None
         self.path = filename
+        self.cache = cache
         self.load()
         print("Read %d bytes from file\n" % len(self.data))
         self.format()
 
     def load(self):
-        """Load image into parser."""
+        """
+        Load image into parser.
+
+        The size of the image is checked before it is read. The image is memory mapped where
+        possible, and read otherwise. Images in zip and gzip archives are decompressed straight
+        into one buffer.
+        """
+        mark = instrument.begin("read")
         try:
             # pylint: disable-next=consider-using-with
             file = open(self.path, "rb")
-            self.data = file.read()
+            size = os.fstat(file.fileno()).st_size
+            kind = magic.detect(file)
+            if kind is not None:
+                # pylint: disable-next=import-outside-toplevel
+                from sg_tools import archive
+                size = archive.size(file, kind)
+            if size + -size % BLOCK > MAXROM:
+                abort("ERROR: ROM file is too large, %dbytes (%dMB) is the maximum"
+                      % (MAXROM, MAXROM/(1024**2)))
+            if kind is not None:
+                self.data = archive.load(file, kind, MAXROM)
+            else:
+                try:
+                    self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    self.data = file.read()
             file.close()
         except IOError:
             abort("%s not found" % self.path)
+        instrument.end(mark)
 
     def format(self):
         """
-        Format image into a raw tuple of bytes, padded with 0s to nearest block size.
+        Format image into a buffer, padded with 0s to nearest block size.
 
-        Max image size 15MB.
+        Max image size 15MB. Interleaved and byte-swapped images are converted to plain images,
+        which then make up the buffer.
         """
-        self.raw = unpack("B"*len(self.data), self.data)
-        if len(self.data) % BLOCK != 0:
-            self.raw = self.raw + (0,) * (BLOCK - len(self.raw) % BLOCK)
-        if len(self.raw) > MAXROM:
-            abort("ERROR: ROM file is too large, %dbytes (%dMB) is the maximum"
-                  % (MAXROM, MAXROM/(1024**2)))
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools import dump
+        mark = instrument.begin("format")
+        self.data, layout = dump.normalize(self.data)
+        instrument.end(mark)
+        if layout:
+            print("Converted %s image" % dump.LAYOUTS[layout].lower())
+        self.image = Image(self.data)
 
     def ident(self, option):
         """
         Load header information of the file and determine whether it is valid and would pass TMSS.
 
-        Sending to the Everdrive still takes place if image is deemed invalid.
+        Sending to the Everdrive still takes place if image is deemed invalid. Only image types of
+        the run mode are matched. The header of a disc image is read wherever its sector format
+        puts it.
         """
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools import decoder, disc
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools.header import WINDOW, Header, shape
+        mark = instrument.begin("ident")
+        if self.cache is not None:
+            self.header = self.cache.get(self.path)
+            if self.header is not None and option in self.header.mode:
+                instrument.end(mark)
+                self.header.metadata()
+                return
+            self.header = None
+        raw = decoder.view(self.data, WINDOW)
+        offset = disc.locate(raw)
+        if offset is not None:
+            raw = raw[offset:offset + disc.HEADER]
         try:
-            match, section = decoder.scan(self.raw, option)
-            if option in "md" and match in "md":
-                self.header = Header.smd()
-            if option in "sms" and match in "sms":
-                self.header = Header.sms(section)
-        except ValidationError:
+            match, section = decoder.scan(raw, option)
+        except decoder.ValidationError:
+            instrument.end(mark)
             print("WARNING: Unofficial image")
             return
-        self.header.retrieve(self.raw)
+        # Header formats are keyed by image type, or by header section for 8-bit images
+        self.header = Header(shape(section or match)).retrieve(raw)
+        instrument.end(mark)
+        if self.cache is not None:
+            self.cache.put(self.path, self.header)
+            self.cache.commit()
         self.header.metadata()
 
 
+class Watcher:
+    """
+    Watcher of changes to an image file.
+
+    inotify is used on Linux, watching the directory of the image so images replaced by a rename
+    are seen as well. Elsewhere, the size and modification time of the image are polled.
+
+    Attributes:
+        path -- string
+    Filepath of the watched image
+        interval -- number
+    Seconds between checks when polling, and between safety checks with inotify
+        stamp -- tuple
+    Size and modification time of the image when last checked, or None if missing
+        inotify -- integer
+    inotify file descriptor, or None when polling
+    """
+
+    # IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE
+    MASK = 0x2 | 0x8 | 0x80 | 0x100
+    EVENT = "iIII"
+
+    def __init__(self, path, interval=POLL):
+        self.path = path
+        self.interval = interval
+        self.stamp = self.check()
+        self.inotify = None
+        try:
+            # pylint: disable-next=import-outside-toplevel
+            import ctypes
+            # pylint: disable-next=import-outside-toplevel
+            from ctypes.util import find_library
+            libc = ctypes.CDLL(find_library("c"), use_errno=True)
+            descriptor = libc.inotify_init()
+        except (ImportError, AttributeError, OSError, TypeError):
+            return
+        if descriptor < 0:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        if libc.inotify_add_watch(descriptor, directory.encode(), self.MASK) < 0:
+            os.close(descriptor)
+            return
+        self.inotify = descriptor
+
+    def check(self):
+        """Return the size and modification time of the image, or None if missing."""
+        try:
+            info = os.stat(self.path)
+        except EnvironmentError:
+            return None
+        return info.st_size, info.st_mtime
+
+    def events(self, timeout):
+        """Return whether inotify reported a change to the image within the timeout."""
+        if not select.select([self.inotify], [], [], timeout)[0]:
+            return False
+        data = os.read(self.inotify, 4096)
+        name = os.path.basename(self.path).encode()
+        size = calcsize(self.EVENT)
+        offset = 0
+        found = False
+        while offset < len(data):
+            length = unpack(self.EVENT, data[offset:offset + size])[3]
+            offset += size
+            found = found or data[offset:offset + length].rstrip(str.encode("\0")) == name
+            offset += length
+        return found
+
+    def wait(self):
+        """Block until the image changes."""
+        while True:
+            if self.inotify is not None:
+                self.events(self.interval)
+            else:
+                sleep(self.interval)
+            stamp = self.check()
+            if stamp != self.stamp:
+                self.stamp = stamp
+                return
+
+    def settle(self, debounce):
+        """
+        Wait until the image stops changing for the debounce period.
+
+        Returns False if the image is missing or empty at the end of it, as when a build failed.
+        """
+        while True:
+            if self.inotify is not None:
+                while self.events(debounce):
+                    pass
+            else:
+                sleep(debounce)
+            stamp = self.check()
+            if stamp == self.stamp:
+                return bool(stamp and stamp[0])
+            self.stamp = stamp
+
+    def close(self):
+        """Stop watching."""
+        if self.inotify is not None:
+            os.close(self.inotify)
+            self.inotify = None
+
+
 class Link:
     """
     Communication interface to Everdrive.
@@ -214,10 +535,13 @@ class Link:
                         "OS": "*ro", "CD": "*rc", "M10": "*rM", "SSF": "*rS", "MD": "*rm"}
 
     def setup(self):
-        """Initiate connection to Everdrive."""
+        """Initiate connection to Everdrive. Returns 1 if the port could not be opened."""
+        # pylint: disable-next=import-outside-toplevel
+        import serial
         print("Connecting to serial...")
         try:
-            self.cxn = serial.Serial(self.port, self.baud, timeout=self.timeout, write_timeout=120)
+            self.cxn = serial.Serial(self.port, self.baud, timeout=self.timeout,
+                                     write_timeout=WRITE_TIMEOUT)
         except serial.serialutil.SerialException:
             abort("ERROR: Cannot find or open serial port %s" % self.port)
         except ValueError:
@@ -225,22 +549,29 @@ class Link:
         except TypeError:
             try:
                 self.cxn = serial.Serial(self.port, self.baud, timeout=self.timeout,
-                                         writeTimeout=120)
+                                         writeTimeout=WRITE_TIMEOUT)
             except OSError:
                 abort("ERROR: Cannot find or open serial port %s" % self.port)
+        if self.cxn is None:
+            return 1
         print("\t %s OK" % self.cxn.port)
+        return None
 
-    def post(self, data, error):
+    def post(self, data, error, drain=True):
         """
         Write data to Everdrive connection.
 
         Keyword:
             data - string of bytes
+            drain - whether to wait for the data to leave the output buffer
         """
+        # pylint: disable-next=import-outside-toplevel
+        import serial
         if not error:
             try:
                 self.cxn.write(data)
-                sleep(0.01)
+                if drain:
+                    self.drain()
             except serial.SerialException:
                 print("ERROR: Sending to MegaED failed")
                 try:
@@ -249,9 +580,26 @@ class Link:
                 except serial.serialutil.SerialException:
                     abort("Connection has closed prematurely")
                 return 1
-        return None
+        return error
+
+    def drain(self):
+        """
+        Wait until written data has left the output buffer of the connection.
 
-    def response(self, ack, error):
+        Replaces fixed delays after each write. Where the connection reports its output buffer,
+        it is polled until empty or until the write timeout passes.
+        """
+        self.cxn.flush()
+        try:
+            waiting = self.cxn.out_waiting
+        except AttributeError:
+            return
+        deadline = time() + WRITE_TIMEOUT
+        while waiting and time() < deadline:
+            sleep(0.001)
+            waiting = self.cxn.out_waiting
+
+    def response(self, ack, error, timeout=None):
         """
         Read response from Everdrive connection.
 
@@ -259,44 +607,86 @@ class Link:
 
         Keyword:
             ack -- string
+            timeout -- seconds to wait for the ack, or None for the read timeout of the link
         """
         if not error:
-            message = self.cxn.read()
+            previous = self.cxn.timeout
+            if timeout is not None:
+                self.cxn.timeout = timeout
+            try:
+                message = self.cxn.read()
+            finally:
+                self.cxn.timeout = previous
             if bytes.decode(message) != ack:
                 abort("ERROR: Invalid response from MegaED")
                 return 1
-        return None
+        return error
+
+    def deadline(self, size, rate):
+        """
+        Return the seconds to wait for the ack of a transfer.
+
+        Keywords:
+            size -- integer, bytes transferred
+            rate -- number, measured bytes per second of the transfer
+        The read timeout of the link is extended by a share of the time the transfer took, so
+        large images on slow links do not time out while the Everdrive stores them.
+        """
+        return float(self.timeout or 0) + ACK_SLACK * size / max(rate, 1)
 
     def test(self):
         """Send init string and check for expected response."""
         print("Testing connection...")
+        mark = instrument.begin("handshake")
         error = self.post(str.encode(self.message["INIT"]), 0)
         error = self.response(self.message["OK"], error)
+        instrument.end(mark)
         if error:
             return 1
         print("\t OK")
         return None
 
-    def transfer(self, raw):
+    def transfer(self, image, chunk=CHUNK, progress=None):
         """
         Send file to Everdrive.
 
         Keyword:
-            raw -- tuple of bytes
+            image -- Image object, or tuple of bytes
+            chunk -- integer, a multiple of the block size
+            progress -- function, or None
 
         Send command to receive a payload. Send size of image in 64k block units. Check for ack.
-        Send image file. Check for ack.
+        Stream image file, followed by its padding, in chunks. Check for ack.
+
+        After each chunk, progress is called with the bytes sent, the total bytes, the throughput
+        of the chunk and the average throughput in bytes per second, and the estimated seconds
+        left.
         """
-        raw = pack("B"*len(raw), *raw)
-        error = self.post(str.encode(self.message["LD"]), 0)
-        error = self.post(pack("B", (int(len(raw)/BLOCK))), error)
+        if chunk <= 0 or chunk % BLOCK:
+            raise ValueError("Chunk size must be a multiple of %d bytes" % BLOCK)
+        if not isinstance(image, Image):
+            image = Image(image)
+        mark = instrument.begin("write")
+        error = self.post(str.encode(self.message["LD"]) + pack("B", image.blocks()), 0)
         error = self.response(self.message["OK"], error)
         if not error:
             print("Sending image data...")
-        error = self.post(serial.to_bytes(raw), error)
+        meter = Meter(len(image))
+        for piece in image.chunks(chunk):
+            error = self.post(piece, error, False)
+            if error:
+                break
+            counts = meter.update(len(piece))
+            if progress is not None:
+                progress(*counts)
         if not error:
+            self.drain()
             print("Checking reponse...")
-        error = self.response(self.message["DOK"], error)
+        instrument.end(mark)
+        mark = instrument.begin("ack")
+        error = self.response(self.message["DOK"], error,
+                              self.deadline(len(image), meter.rate()))
+        instrument.end(mark)
         return error
 
     def run(self, mode):
@@ -306,11 +696,234 @@ class Link:
         Keyword:
             mode -- string
         """
+        mark = instrument.begin("run")
         error = self.post(str.encode(self.message[mode.upper()]), 0)
         error = self.response(self.message["OK"], error)
+        instrument.end(mark)
         return error
 
 
+def remembered():
+    """Return the path of the file keeping the port an Everdrive last answered on."""
+    # pylint: disable-next=import-outside-toplevel
+    from sg_tools.cache import location
+    return os.path.join(os.path.dirname(location()), "port")
+
+
+def recall():
+    """Return the port an Everdrive last answered on, or None."""
+    try:
+        file = open(remembered())
+        try:
+            return file.read().strip() or None
+        finally:
+            file.close()
+    except EnvironmentError:
+        return None
+
+
+def remember(port):
+    """Keep the port an Everdrive answered on, for the next scan."""
+    try:
+        path = remembered()
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        file = open(path, "w")
+        file.write(port)
+        file.close()
+    except EnvironmentError:
+        pass
+
+
+def candidates():
+    """
+    Return the ports of FTDI chips used by Everdrives.
+
+    Ports are matched on USB vendor and product IDs, or on the manufacturer where the IDs are not
+    reported.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from serial.tools import list_ports
+    found = []
+    for port in list_ports.comports():
+        if (port.vid, port.pid) in USB_IDS or (port.vid is None and port.manufacturer == "FTDI"):
+            found.append(port.device)
+    return found
+
+
+def probe(port, baud, timeout):
+    """
+    Send the init string to a port and check for the ack, within the probe timeout.
+
+    Returns a Link open on the port, with the read timeout given and the write timeout of a
+    transfer, or None if there was no ack.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import serial
+    try:
+        try:
+            cxn = serial.Serial(port, baud, timeout=PROBE_TIMEOUT, write_timeout=PROBE_TIMEOUT)
+        except TypeError:
+            cxn = serial.Serial(port, baud, timeout=PROBE_TIMEOUT, writeTimeout=PROBE_TIMEOUT)
+    except (serial.SerialException, EnvironmentError, ValueError):
+        return None
+    link = Link(port, baud, timeout)
+    try:
+        cxn.write(str.encode(link.message["INIT"]))
+        answer = cxn.read(1)
+    except (serial.SerialException, EnvironmentError):
+        answer = None
+    if answer != str.encode(link.message["OK"]):
+        cxn.close()
+        return None
+    cxn.timeout = timeout
+    if hasattr(cxn, "write_timeout"):
+        cxn.write_timeout = WRITE_TIMEOUT
+    else:
+        cxn.writeTimeout = WRITE_TIMEOUT
+    link.cxn = cxn
+    return link
+
+
+def probe_all(ports, baud, timeout):
+    """Probe ports concurrently, returning a Link to each port that answered, in order."""
+    # pylint: disable-next=import-outside-toplevel
+    import threading
+    results = {}
+
+    def run(port):
+        results[port] = probe(port, baud, timeout)
+
+    threads = [threading.Thread(target=run, args=(port, )) for port in ports]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[port] for port in ports if results[port] is not None]
+
+
+def discover(baud=9600, timeout=1, wait=0):
+    """
+    Return a Link to an Everdrive that answered the init string, or None.
+
+    Keywords:
+        baud -- integer
+        timeout -- read timeout of the link
+        wait -- seconds to wait for the Everdrive to be plugged in
+    The port an Everdrive last answered on is tried first. Ports of FTDI chips are then probed
+    concurrently, and listed again until the wait times out.
+    """
+    last = recall()
+    if last is not None:
+        link = probe(last, baud, timeout)
+        if link is not None:
+            return link
+    deadline = time() + wait
+    while True:
+        links = probe_all(candidates(), baud, timeout)
+        for link in links[1:]:
+            link.cxn.close()
+        if links:
+            remember(links[0].port)
+            return links[0]
+        if time() >= deadline:
+            return None
+        sleep(HOTPLUG_POLL)
+
+
+def deliver(image, port, cxn=(9600, 1, ), mode="md", chunk=CHUNK, link=None):
+    """
+    Send an image to one Everdrive and run it, timing each step.
+
+    Keywords:
+        image -- Image object, shared read-only with other deliveries
+        port -- string
+        cxn -- tuple of baud rate and read timeout
+        mode -- string, run mode
+        chunk -- integer, transfer chunk size
+        link -- Link already open and tested on the port, or None to connect
+    Returns a dict of the port, the seconds taken to connect, transfer and run, and overall, the
+    average transfer rate in bytes per second, and an error message or None.
+    """
+    result = {"port": port, "connect": 0.0, "transfer": 0.0, "run": 0.0, "total": 0.0,
+              "rate": 0.0, "error": None}
+    start = last = time()
+    step = "connect"
+    try:
+        if link is None:
+            link = Link(port, cxn[0], cxn[1])
+            if link.setup() or link.test():
+                raise IOError()
+        now = time()
+        result["connect"], last, step = now - last, now, "transfer"
+        if link.transfer(image, chunk):
+            raise IOError()
+        now = time()
+        result["transfer"], last, step = now - last, now, "run"
+        result["rate"] = len(image) / max(result["transfer"], 1e-6)
+        if link.run(mode):
+            raise IOError()
+        result["run"] = time() - last
+    # pylint: disable-next=broad-except
+    except (Exception, SystemExit):  # abort() exits when run as a script
+        result["error"] = "%s failed" % step
+        if not isinstance(sys.exc_info()[1], SystemExit) and str(sys.exc_info()[1]):
+            result["error"] += ": %s" % sys.exc_info()[1]
+        result[step] = time() - last
+    if link is not None and link.cxn is not None:
+        link.cxn.close()
+    result["total"] = time() - start
+    return result
+
+
+def fanout(filepath, ports=None, cxn=(9600, 1, ), mode="md", chunk=CHUNK, cache=None):
+    """
+    Send an image to many Everdrives at once, and run it on each.
+
+    Keywords:
+        filepath -- string
+        ports -- list of ports, or None for every Everdrive that answers on an FTDI port
+        cxn -- tuple of baud rate and read timeout
+        mode -- string, run mode
+        chunk -- integer, transfer chunk size
+        cache -- Cache object, or None
+    The image is read and padded once, and its buffer shared by one thread per Everdrive.
+    Returns a list of the report of each delivery, in port order. See deliver().
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import threading
+    parser = Parser(filepath, cache)
+    parser.ident(mode)
+    if ports is None:
+        links = probe_all(candidates(), cxn[0], cxn[1])
+        ports = [link.port for link in links]
+    else:
+        links = [None] * len(ports)
+    reports = [None] * len(ports)
+
+    def run(index):
+        reports[index] = deliver(parser.image, ports[index], cxn, mode, chunk, links[index])
+
+    threads = [threading.Thread(target=run, args=(index, )) for index in range(len(ports))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return reports
+
+
+def summary(reports, elapsed):
+    """Display the timing and outcome of each delivery of a fan-out."""
+    print("\n%-24s %9s %9s %9s %9s %10s  %s"
+          % ("Port", "Connect", "Transfer", "Run", "Total", "kB/s", "Result"))
+    for result in reports:
+        print("%-24s %8.2fs %8.2fs %8.2fs %8.2fs %10.1f  %s"
+              % (result["port"], result["connect"], result["transfer"], result["run"],
+                 result["total"], result["rate"] / 1024, result["error"] or "OK"))
+    failed = len([result for result in reports if result["error"]])
+    print("%d of %d Everdrives started in %.2fs" % (len(reports) - failed, len(reports), elapsed))
+
+
 def abort(message, level=1):
     """Print a message to screen and quit module."""
     print(message)
@@ -318,6 +931,16 @@ def abort(message, level=1):
         raise SystemExit(level)
 
 
+def report(sent, total, rate, average, eta):
+    """Display a live progress line of an image transfer."""
+    sys.stdout.write("\r\t%3d%% %7dkB of %dkB  %6.1fkB/s (avg %6.1fkB/s)  ETA %3ds "
+                     % (sent * 100 // total, sent // 1024, total // 1024, rate / 1024,
+                        average / 1024, eta + 0.5))
+    if sent >= total:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
 def parse_options():
     """Parse arguments from command line."""
     if "-h" in argv:
@@ -327,16 +950,51 @@ def parse_options():
     options = {"file": argv[-1], }
     pos = 1
     for arg in argv[pos:]:
-        if arg[0].startswith("-"):
-            if arg[1] in ["b", "m", "p", "t"] and not argv[pos+1][0].startswith("-"):
+        if arg in ("-a", "-c", "--watch"):
+            options[arg] = True
+        elif arg.startswith("--profile"):
+            options["--profile"] = arg[len("--profile="):] or True
+        elif arg[0].startswith("-"):
+            if arg[1] in ["b", "k", "m", "p", "t", "w"] and not argv[pos+1][0].startswith("-"):
                 options[arg] = argv[pos+1]
         pos += 1
     return options
 
 
+def broadcast(filepath, options):
+    """Send an image to every Everdrive found, or listed, at once. Return the exit status."""
+    began = time()
+    store = None
+    if "-c" in options:
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools import cache
+        store = cache.Cache()
+    reports = fanout(filepath, options.get("-p") and options["-p"].split(","),
+                     (int(options.get("-b", 9600)), float(options.get("-t", 1)), ),
+                     options.get("-m", "md"), int(options.get("-k", 0)) * BLOCK or CHUNK, store)
+    if store is not None:
+        store.close()
+    summary(reports, time() - began)
+    failures = [entry for entry in reports if entry["error"]]
+    return not reports or len(failures) > 0
+
+
 if __name__ == "__main__":
     opts = parse_options()
-    image = opts.pop("file")
-    app = Loader(image, **opts)
-    app.init()
-    app.start()
+    source = opts.pop("file")
+    watching = opts.pop("--watch", False)
+    if "--profile" in opts:
+        instrument.option(opts.pop("--profile"))
+    try:
+        if opts.pop("-a", False):
+            raise SystemExit(broadcast(source, opts))
+        app = Loader(source, progress=report, **opts)
+        app.init()
+        app.start()
+        if watching:
+            try:
+                app.watch()
+            except KeyboardInterrupt:
+                print("")
+    finally:
+        instrument.stop(sys.stderr)
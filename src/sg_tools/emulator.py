@@ -0,0 +1,224 @@
+#!/usr/bin/python
+"""
+Pseudo-terminal stand-in for a Mega EverDrive X7.
+
+Opens a pseudo-terminal pair and speaks the part of the Everdrive USB protocol used by edsend,
+so Link and Loader can be tested and benchmarked without a cart attached:
+
+    "    *T"                    -> "k"
+    "*g", block count, payload  -> "k" after the count, "d" after the payload
+    "*r" and a run mode         -> "k"
+
+Latency per byte, a bandwidth cap, dropped acks and disconnects part way through a transfer can
+be configured. Unix-like systems only.
+"""
+
+import os
+import select
+import sys
+import threading
+import tty
+from time import sleep, time
+
+from sg_tools.edsend import BLOCK
+
+USAGE = """Usage: %s [options]
+Emulate a Mega Everdrive X7 on a pseudo-terminal, until interrupted
+Options:
+    -l  Latency per byte (s)
+    -w  Bandwidth cap (bytes/s)
+    -d  Acks to drop (e.g. d, or kd)
+    -x  Disconnect after this many payload bytes
+
+    -h  Print this help message
+
+Example sending an image to the emulator:
+    %s -w 1000000 &
+    edsend -p /dev/pts/5 file.bin"""
+
+COMMANDS = (b"    *T", b"*g", b"*r")
+RUN_MODES = {"s": "sms", "o": "os", "c": "cd", "M": "m10", "S": "ssf", "m": "md"}
+
+
+class Emulator:
+    """
+    Emulated Everdrive on the slave side of a pseudo-terminal.
+
+    Attributes:
+        port -- string
+    Path of the pseudo-terminal to open as the Everdrive serial port.
+        latency -- number
+    Seconds taken per byte received.
+        bandwidth -- number
+    Cap on bytes received per second, or None.
+        drop -- string
+    Acks that are never sent, such as "d" to drop the transfer ack.
+        disconnect -- integer
+    Number of payload bytes after which the emulator hangs up, or None.
+        image -- bytes
+    Payload of the last transfer.
+        runs -- list
+    Run modes received, in order.
+        stats -- dict
+    Bytes received, and seconds spent receiving the last payload.
+    """
+
+    def __init__(self, latency=0, bandwidth=None, drop="", disconnect=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop = drop
+        self.disconnect = disconnect
+        self.image = b""
+        self.runs = []
+        self.stats = {"received": 0, "elapsed": 0.0}
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Serve the protocol on a background thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the pseudo-terminal."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.hangup()
+        for descriptor in (self.slave, ):
+            try:
+                os.close(descriptor)
+            except OSError:
+                pass
+
+    def hangup(self):
+        """Close the master side, as if the cart were unplugged."""
+        if self.master is not None:
+            try:
+                os.close(self.master)
+            except OSError:
+                pass
+            self.master = None
+
+    def read(self, size):
+        """
+        Read up to size bytes from the host, or None once stopped or disconnected.
+
+        Reads are throttled by the latency and bandwidth settings.
+        """
+        while self.running and self.master is not None:
+            if not select.select([self.master], [], [], 0.05)[0]:
+                continue
+            try:
+                data = os.read(self.master, size)
+            except OSError:
+                return None
+            delay = len(data) * self.latency
+            if self.bandwidth:
+                delay += float(len(data)) / self.bandwidth
+            if delay:
+                sleep(delay)
+            self.stats["received"] += len(data)
+            return data
+        return None
+
+    def ack(self, message):
+        """Send an ack to the host, unless configured to drop it."""
+        if message in self.drop or self.master is None:
+            return
+        os.write(self.master, message.encode())
+
+    def receive(self, size):
+        """Receive size bytes of payload, hanging up part way if configured to."""
+        chunks = []
+        received = 0
+        start = time()
+        while received < size:
+            limit = size - received
+            if self.disconnect is not None:
+                limit = min(limit, self.disconnect - received)
+                if limit <= 0:
+                    self.hangup()
+                    return None
+            piece = self.read(min(limit, BLOCK))
+            if piece is None:
+                return None
+            chunks.append(piece)
+            received += len(piece)
+        self.stats["elapsed"] = time() - start
+        return b"".join(chunks)
+
+    def serve(self):
+        """Answer commands from the host until stopped."""
+        buffer = b""
+        while self.running:
+            piece = self.read(64)
+            if piece is None:
+                return
+            buffer += piece
+            while self.running:
+                if buffer.startswith(b"    *T"):
+                    buffer = buffer[6:]
+                    self.ack("k")
+                elif buffer.startswith(b"*g") and len(buffer) >= 3:
+                    blocks = ord(buffer[2:3])
+                    self.ack("k")
+                    payload = buffer[3:3 + blocks * BLOCK]
+                    buffer = buffer[3 + len(payload):]
+                    rest = self.receive(blocks * BLOCK - len(payload))
+                    if rest is None:
+                        return
+                    self.image = payload + rest
+                    self.ack("d")
+                elif buffer.startswith(b"*r") and len(buffer) >= 3:
+                    self.runs.append(RUN_MODES.get(buffer[2:3].decode(), "unknown"))
+                    buffer = buffer[3:]
+                    self.ack("k")
+                elif buffer and not [command for command in COMMANDS
+                                     if command.startswith(buffer[:len(command)])]:
+                    buffer = buffer[1:]  # noise between commands
+                else:
+                    break
+
+
+def parse_options():
+    """Parse arguments from command line."""
+    if "-h" in sys.argv:
+        print(USAGE % (sys.argv[0], sys.argv[0]))
+        raise SystemExit(0)
+    options = {}
+    args = iter(sys.argv[1:])
+    for arg in args:
+        value = next(args, None)
+        if arg == "-l":
+            options["latency"] = float(value)
+        elif arg == "-w":
+            options["bandwidth"] = float(value)
+        elif arg == "-d":
+            options["drop"] = value
+        elif arg == "-x":
+            options["disconnect"] = int(value)
+        else:
+            print(USAGE % (sys.argv[0], sys.argv[0]))
+            raise SystemExit(1)
+    return options
+
+
+if __name__ == "__main__":
+    device = Emulator(**parse_options()).start()
+    print("Emulating Mega Everdrive X7 on %s" % device.port)
+    sys.stdout.flush()
+    try:
+        while True:
+            sleep(1)
+            if device.runs:
+                print("Received %d bytes, running as %s" % (len(device.image), device.runs.pop()))
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        device.stop()
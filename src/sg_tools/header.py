@@ -2,10 +2,13 @@
 # -*- coding: utf8 -*-
 """Image File Header Analyzer for Sega 8-bit and 16-bit."""
 
+import mmap
+import os
+import stat
+import struct
 import sys
-from struct import unpack
 
-from sg_tools import decoder
+from sg_tools import decoder, disc, dump, instrument, magic
 
 if sys.version[0] in '2':
     from backport.ordereddict import OrderedDict
@@ -14,7 +17,32 @@ if sys.version[0] in '2':
     dict = OrderedDict
 
 
-class Header:
+USAGE = """Usage: %s [options] file...
+Display the header information of a Sega image, or catalog many images
+Options:
+    -c  Use the header cache
+    -d  Identify images against the DAT index (see sg-tools dat)
+    -f  Batch output format (ndjson or csv)
+    -j  Number of decoding processes
+    -t  Time limit per file (s)
+
+    --profile[=file]  Report the time and memory of each stage, and write a cProfile dump to file
+    -h  Print this help message
+
+Batch mode is used when more than one file, a directory, or -f is given. One record per image
+is written as each one finishes. With --profile, only the main process is profiled, so use -j 1
+to profile decoding.
+
+Example cataloging a directory tree on Ubuntu:
+    %s -f csv -j 4 -t 5 /path/to/roms > catalog.csv"""
+
+# End of the last header window (8-bit header at 0x81f0)
+WINDOW = 0x8200
+TYPES = {"md": "Image type: 16-bit image", "sms": "Image type: 8-bit image",
+         "cd": "Image type: Sega CD disc image", "sg": "Image type: SG-1000 image, without header"}
+
+
+class Header(object):
     """
     Header information for an image file of Sega 8-bit and 16-bit consoles.
 
@@ -24,47 +52,89 @@ class Header:
     checksum, a region, a size, a version number and a product number. Genesis/Mega Drive software
     contain additional details. Upon instance creation, the type of image is determined.
 
+    A Header is a compact record: the Format of its fields is shared by every header of the same
+    type, and the decoded values are a tuple in the order of the fields, with any lists among them
+    made tuples too. Only retrieve() changes the values, decoding them in place; it returns the
+    Header as well, so either style of call works.
+
     Attributes:
-        block -- dict
-    Header block information for each metadata category of the detected image type.
+        format -- object
+    Format of the header fields, shared with every header of the same type.
+        values -- tuple
+    Decoded value of each field, in the order of the format, or None until retrieved.
+        path -- string
+    Filepath of the image the header was read from, if known.
     """
 
-    def __init__(self, block):
-        self.block = block
+    __slots__ = ("format", "values", "path")
+
+    def __init__(self, form, values=None, path=None):
+        self.format = form
+        self.values = freeze(values)
+        self.path = path
+
+    def __setattr__(self, name, value):
+        if name != "path" and hasattr(self, name):
+            raise AttributeError("Header %s cannot be changed" % name)
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (Header, (self.format, self.values, self.path))
+
+    def mode(self):
+        """Type of image the header format is for, either md, sms, cd or sg."""
+        return self.format.mode
+    mode = property(mode)
+
+    def layout(self):
+        """Compiled Layout of the header format, if any."""
+        return self.format.layout
+    layout = property(layout)
+
+    def block(self):
+        """Header block information for each field, with its decoded value once retrieved."""
+        block = dict()
+        for field in self.format.fields:
+            block[field] = list(self.format.specs[field])
+            if self.values is not None:
+                block[field].append(self.get(field))
+        return block
+    block = property(block)
 
     # pylint: disable-next=invalid-name
     def smd(cls):
         """Header format for 16-bit (and 32X) images."""
-        return cls(dict([("system", [0x100, 0x10, "System Type"]),
-                         ("copyright", [0x110, 0x10, "Copyright"]),
-                         ("domestic", [0x120, 0x30, "Japan Title"]),
-                         ("export", [0x150, 0x30, "Export Title"]),
-                         ("serial", [0x180, 0xe, "Serial"]),
-                         ("checksum", [0x18e, 0x2, "Checksum"]),
-                         ("device", [0x190, 0x10, "Devices Supported"]),
-                         ("romrange", [0x1a0, 0x8, ["ROM", "Min Offset", "Max offset", "kB"]]),
-                         ("ramrange", [0x1a8, 0x8, ["RAM", "Min Offset", "Max offset", "kB"]]),
-                         ("extra", [0x1b0, 0xc, ["SRAM", "Type", "Width", "Min", "Max", "kB"]]),
-                         ("modem", [0x1bc, 0xc, ["Modem", "Publisher", "Game Number", "Version",
-                                                 "Japan Support", "Export Support"]]),
-                         ("region", [0x1f0, 0x3, "Regions"])]))
+        return cls(shape("md"))
     # pylint: disable-next=no-classmethod-decorator
     smd = classmethod(smd)
 
     def sms(cls, qword):
         """Header format for 8=bit images. There are two known offsets with header information."""
-        return cls(dict([("system", [decoder.join(qword, "f0"), 0x8]),
-                         ("checksum", [decoder.join(qword, "fa"), 0x2, "Checksum"]),
-                         ("prod", [decoder.join(qword, "fc"), 0x3, "Product Number"]),
-                         ("version", [decoder.join(qword, "fe"), 0x1, "Version"]),
-                         ("size", [decoder.join(qword, "ff"), 0x1, "Size"]),
-                         ("m3region", [decoder.join(qword, "ff"), 0x1, "Region"])]))
+        return cls(shape(qword))
     # pylint: disable-next=no-classmethod-decorator
     sms = classmethod(sms)
 
+    def cd(cls):
+        """Header format for Sega CD/Mega CD disc images."""
+        return cls(shape("cd"))
+    # pylint: disable-next=no-classmethod-decorator
+    cd = classmethod(cd)
+
+    def sg(cls):
+        """Header format for SG-1000 images, which only have their start up code to show."""
+        return cls(shape("sg"))
+    # pylint: disable-next=no-classmethod-decorator
+    sg = classmethod(sg)
+
+    def get(self, field, default=None):
+        """Return the decoded value of a field, or the default if not retrieved."""
+        if self.values is None:
+            return default
+        return self.values[self.format.index[field]]
+
     def fields(self):
         """List Header object's segment fields."""
-        for field in list(self.block):
+        for field in self.format.fields:
             print(field)
 
     def display(self, field):
@@ -75,23 +145,27 @@ class Header:
             field -- string
         Display metadata of segment name given
         """
-        if len(self.block[field]) > 3:
-            if isinstance(self.block[field][-1], list):
-                if isinstance(self.block[field][2], list):
-                    print("%s" % self.block[field][2][0])
-                    for title, meta in zip(self.block[field][2][1:], self.block[field][3]):
-                        print("\t%s: %s" % (title, meta))
-                else:
-                    print("%s" % self.block[field][2])
-                    for meta in self.block[field][3]:
-                        print("\t%s" % meta)
-            elif isinstance(self.block[field][2], list):
-                print("%s: %s" % (self.block[field][2][0], self.block[field][-1]))
+        spec = self.format.specs[field]
+        if self.values is None or len(spec) < 3:
+            return
+        label = spec[2]
+        value = self.get(field)
+        if isinstance(value, tuple):
+            if isinstance(label, list):
+                print("%s" % label[0])
+                for title, meta in zip(label[1:], value):
+                    print("\t%s: %s" % (title, meta))
             else:
-                try:
-                    print("%s: %s" % (self.block[field][2], self.block[field][-1]))
-                except UnicodeEncodeError:
-                    print("%s: %s" % (self.block[field][2], self.block[field][-1].encode('utf8')))
+                print("%s" % label)
+                for meta in value:
+                    print("\t%s" % meta)
+        elif isinstance(label, list):
+            print("%s: %s" % (label[0], value))
+        else:
+            try:
+                print("%s: %s" % (label, value))
+            except UnicodeEncodeError:
+                print("%s: %s" % (label, value.encode('utf8')))
 
     def metadata(self, segment=None):
         """
@@ -103,7 +177,7 @@ class Header:
         segments.
         """
         if segment is None:
-            for field in self.block:
+            for field in self.format.fields:
                 self.display(field)
         else:
             try:
@@ -113,57 +187,400 @@ class Header:
                 print("Valid fields:")
                 self.fields()
 
+    def record(self):
+        """
+        Return the decoded header information as a flat mapping.
+
+        Each field maps to its decoded value, so the header can be written out as a JSON object
+        or a CSV row.
+        """
+        values = dict([("path", self.path)])
+        if self.values is not None:
+            for field, value in zip(self.format.fields, self.values):
+                if len(self.format.specs[field]) > 2:
+                    values[field] = value
+        return values
+
     def retrieve(self, data):
         """
-        Retrieve decoded header information.
+        Decode the header information into this Header, and return it.
 
         Keyword:
-            data -- tuple
-        Pass through all metadata fields of Header to decoder and append results to Header
+            data -- tuple, or buffer
+        Pass through all metadata fields of the format to decoder. With a compiled layout, every
+        field is extracted from a buffer at once. Values decoded before are replaced.
         """
-        for field in self.block:
-            offset = self.block[field][0]
-            length = self.block[field][1]
-            self.block[field].append(decoder.decode(field, data[offset: offset + length]))
+        form = self.format
+        values = None
+        if form.layout is not None and not isinstance(data, tuple):
+            try:
+                segments = form.layout.unpack(data)
+            except struct.error:  # image ends within the header
+                segments = None
+            if segments is not None:
+                values = [decoder.decode(field, segment) for field, segment
+                          in zip(form.fields, segments)]
+        if values is None:
+            values = []
+            for field in form.fields:
+                offset, length = form.specs[field][:2]
+                values.append(decoder.decode(field, data[offset: offset + length]))
+        object.__setattr__(self, "values", freeze(values))
+        return self
+
+
+class Format(object):
+    """
+    Fields of a header format, shared by every Header of that format.
+
+    Attributes:
+        key -- string
+    Key of the header format in FORMATS: md, cd, sg, or the section of an 8-bit header.
+        mode -- string
+    Type of image the header format is for.
+        fields -- tuple
+    Field names, in the order of the header format.
+        specs -- dict
+    Offset, length and label of each field.
+        index -- dict
+    Position of each field in the values of a Header.
+        layout -- object
+    Compiled Layout of the header format, if supported by this version of Python.
+    """
+
+    def __init__(self, key):
+        template = FORMATS[key]
+        self.key = key
+        self.mode = MODES.get(key, "sms")
+        self.fields = tuple([field for field, spec in template])
+        self.specs = dict(template)
+        self.index = dict([(field, index) for index, field in enumerate(self.fields)])
+        self.layout = compile_format(template)
 
+    def __reduce__(self):
+        # Formats are shared, so a pickled header refers to its format by key
+        return (shape, (self.key, ))
 
-def abort(message):
+
+def abort(message, level=1):
     """Print a message to screen and quit module."""
     print(message)
     if __name__ == "__main__":
-        raise SystemExit(1)
+        raise SystemExit(level)
+
+
+class Layout:
+    """
+    Compiled layout of a header format.
+
+    The fields of a header format are packed into a single struct.Struct, so that a whole header
+    is extracted from a buffer with one unpack_from(). Fields lying within another field, such as
+    the version nibble of an 8-bit product number, are sliced out of the unpacked field.
+
+    Attributes:
+        fields -- list
+    Field names, in the order of the header format.
+        layout -- object
+    struct.Struct of every field not lying within another, starting at the first field.
+        sources -- list
+    For each field, the index of the unpacked value holding it, and the slice of it to take.
+        template -- tuple
+    Header format the layout was compiled from.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = [field for field, spec in template]
+        spans = []
+        bounds = [(spec[0], -spec[0] - spec[1]) for field, spec in template]
+        bounds.sort()
+        for offset, end in bounds:
+            if not spans or -end > spans[-1][0] + spans[-1][1]:  # not within the last span
+                spans.append((offset, -end - offset))
+        self.base = spans[0][0]
+        pattern = ">"
+        end = self.base
+        for offset, length in spans:
+            if offset < end:
+                raise ValueError("Overlapping header fields at 0x%x" % offset)
+            pattern += "%dx%ds" % (offset - end, length)
+            end = offset + length
+        self.layout = struct.Struct(pattern)
+        self.sources = []
+        for field, spec in template:
+            for index, (offset, length) in enumerate(spans):
+                if offset <= spec[0] and spec[0] + spec[1] <= offset + length:
+                    self.sources.append((index, spec[0] - offset, spec[0] - offset + spec[1]))
+                    break
+
+    def __reduce__(self):
+        # struct.Struct does not pickle, so the layout is compiled again from its format
+        return (Layout, (self.template, ))
 
+    def unpack(self, data):
+        """Return the raw segment of every field of a header in a buffer."""
+        values = self.layout.unpack_from(data, self.base)
+        return [values[index][start:end] for index, start, end in self.sources]
 
-def load(filename=sys.argv[-1]):
-    """Open and prepare file image."""
+
+def sms_format(qword):
+    """Return the header format of 8-bit images with a header at the offset given."""
+    return (("system", (decoder.join(qword, "f0"), 0x8)),
+            ("checksum", (decoder.join(qword, "fa"), 0x2, "Checksum")),
+            ("prod", (decoder.join(qword, "fc"), 0x3, "Product Number")),
+            ("version", (decoder.join(qword, "fe"), 0x1, "Version")),
+            ("size", (decoder.join(qword, "ff"), 0x1, "Size")),
+            ("m3region", (decoder.join(qword, "ff"), 0x1, "Region")))
+
+
+def freeze(value):
+    """Return a decoded value, or a sequence of them, with every list in it made a tuple."""
+    if isinstance(value, (list, tuple)):
+        return tuple([freeze(item) for item in value])
+    return value
+
+
+def compile_format(template):
+    """Return the compiled Layout of a header format, if supported by this version of Python."""
+    if sys.version[0] in '2':
+        return None
+    return Layout(template)
+
+
+# Header formats, by image type or 8-bit header offset
+FORMATS = {"md": (("system", (0x100, 0x10, "System Type")),
+                  ("copyright", (0x110, 0x10, "Copyright")),
+                  ("domestic", (0x120, 0x30, "Japan Title")),
+                  ("export", (0x150, 0x30, "Export Title")),
+                  ("serial", (0x180, 0xe, "Serial")),
+                  ("checksum", (0x18e, 0x2, "Checksum")),
+                  ("device", (0x190, 0x10, "Devices Supported")),
+                  ("romrange", (0x1a0, 0x8, ["ROM", "Min Offset", "Max offset", "kB"])),
+                  ("ramrange", (0x1a8, 0x8, ["RAM", "Min Offset", "Max offset", "kB"])),
+                  ("extra", (0x1b0, 0xc, ["SRAM", "Type", "Width", "Min", "Max", "kB"])),
+                  ("modem", (0x1bc, 0xc, ["Modem", "Publisher", "Game Number", "Version",
+                                          "Japan Support", "Export Support"])),
+                  ("region", (0x1f0, 0x3, "Regions"))),
+           "cd": (("disc", (0x0, 0x10, "Disc Type")),
+                  ("volume", (0x10, 0xb, "Volume Name")),
+                  ("sysname", (0x20, 0xb, "System Name")),
+                  ("date", (0x50, 0x10, "Build Date")),
+                  ("system", (0x100, 0x10, "System Type")),
+                  ("copyright", (0x110, 0x10, "Copyright")),
+                  ("domestic", (0x120, 0x30, "Japan Title")),
+                  ("export", (0x150, 0x30, "Export Title")),
+                  ("serial", (0x180, 0xe, "Serial")),
+                  ("device", (0x190, 0x10, "Devices Supported")),
+                  ("region", (0x1f0, 0x3, "Regions"))),
+           "sdsc": (("sdscversion", (0x7fe4, 0x2, "SDSC Version")),
+                    ("sdscdate", (0x7fe6, 0x4, "Release Date"))) + sms_format("7f"),
+           "sg": (("entry", (0x0, 0x4, "Start Up Code")), ),
+           "7f": sms_format("7f"),
+           "81": sms_format("81")}
+# Image type of each header format, other than 8-bit headers
+MODES = {"md": "md", "cd": "cd", "sg": "sg"}
+# Shared Format of each header format, compiled when first needed
+SHAPES = {}
+
+
+def shape(key):
+    """
+    Return the shared Format of a header format.
+
+    Keyword:
+        key -- string, md, cd, sg, or the section of an 8-bit header
+    8-bit header formats at offsets not in FORMATS are added to it.
+    """
+    if key not in SHAPES:
+        if key not in FORMATS:
+            FORMATS[key] = sms_format(key)
+        SHAPES[key] = Format(key)
+    return SHAPES[key]
+
+
+def window(file):
+    """
+    Map the header windows of an open image file.
+
+    Keyword:
+        file -- file object
+    Only the start of the image, up to the end of the last header window, is mapped, and only the
+    pages of it that get sliced are read from disk. Files that cannot be mapped, such as empty
+    files or pipes, are read up to the same offset instead. For zip and gzip archives, only the
+    start of the image is decompressed, up to the same offset.
+    """
+    info = os.fstat(file.fileno())
+    if stat.S_ISREG(info.st_mode):
+        kind = magic.detect(file)
+        if kind is not None:
+            # pylint: disable-next=import-outside-toplevel
+            from sg_tools import archive
+            return archive.prefix(file, kind, WINDOW)
+    span = min(info.st_size, WINDOW)
+    try:
+        return mmap.mmap(file.fileno(), span, access=mmap.ACCESS_READ)
+    except (ValueError, EnvironmentError):
+        return file.read(WINDOW)
+
+
+def normalize(data):
+    """
+    Return the header windows of an image as those of a plain image, and its original layout.
+
+    The header of a disc image is returned on its own, wherever its sector format puts it.
+    """
+    offset = disc.locate(data)
+    if offset is not None:
+        return data[offset:offset + disc.HEADER], None
+    return dump.window(data)
+
+
+def load(filename=None, verbose=True, cache=None):
+    """
+    Open and prepare the header windows of a file image.
+
+    Keywords:
+        filename -- string, or None for the last command line argument
+        verbose -- boolean
+        cache -- Cache object, or None
+    If a cache is given, a header cached for the unchanged image is returned without reading it,
+    and newly decoded headers are added to the cache. For a CUE sheet, the header of its first
+    data track is read.
+    """
+    if filename is None:
+        filename = sys.argv[-1]
     try:
-        # pylint: disable-next=consider-using-with
-        file = open(filename, "rb")
-        image = file.read()
-        file.close()
-        if filename in sys.argv[-1]:
-            print("Read %d bytes from file\n" % len(image))
-        raw = unpack("B"*len(image), image)
+        if verbose and filename in sys.argv[-1]:
+            print("Image size: %d bytes\n" % os.path.getsize(filename))
+        if cache is not None:
+            keys = cache.get(filename)
+            if keys is not None:
+                if verbose:
+                    print(TYPES[keys.mode])
+                return keys
+        mark = instrument.begin("read")
+        if filename.lower().endswith(".cue"):
+            image = disc.read(filename)
+        else:
+            # pylint: disable-next=consider-using-with
+            file = open(filename, "rb")
+            image = window(file)
+            file.close()
+        instrument.end(mark)
     except IOError:
-        abort("%s not found" % sys.argv[-1])
-    return populate(raw)
+        if os.path.exists(filename):
+            abort("ERROR: %s: %s" % (filename, sys.exc_info()[1]))
+        else:
+            abort("%s not found" % filename)
+        return None
+    mark = instrument.begin("layout")
+    plain, layout = normalize(image)
+    instrument.end(mark)
+    if verbose and layout:
+        print("Image layout: %s" % dump.LAYOUTS[layout])
+    raw = decoder.view(plain)
+    try:
+        keys = populate(raw, verbose)
+    finally:
+        if hasattr(raw, "release"):
+            raw.release()
+        if hasattr(image, "close"):
+            try:
+                image.close()
+            except BufferError:
+                pass
+    keys.path = filename
+    if cache is not None:
+        cache.put(filename, keys)
+    return keys
 
 
-def populate(image):
+def populate(image, verbose=True):
     """Populate key data for header being accessed."""
+    mark = instrument.begin("scan")
     mode, section = decoder.scan(image)
-    if mode in "md":
-        print("Image type: 16-bit image")
-        keys = Header.smd()
-    if mode in "sms":
-        print("Image type: 8-bit image")
-        keys = Header.sms(section)
+    instrument.end(mark)
+    # Header formats are keyed by image type, or by header section for 8-bit images
+    keys = Header(shape(section or mode))
+    if verbose:
+        print(TYPES[mode])
+    mark = instrument.begin("retrieve")
     keys.retrieve(image)
+    instrument.end(mark)
     return keys
 
 
-if __name__ == "__main__":
-    if len(sys.argv) <= 1:
+def parse_options():
+    """Parse arguments from command line."""
+    if "-h" in sys.argv:
+        abort(USAGE % (sys.argv[0], sys.argv[0]), 0)
+    if len(sys.argv) < 2:
         abort("No filename")
-    header = load()
-    header.metadata()
+    options = {"paths": []}
+    args = sys.argv[1:]
+    while args:
+        arg = args.pop(0)
+        if arg in ["-c", "-d"]:
+            options[arg] = True
+        elif arg.startswith("--profile"):
+            options["--profile"] = arg[len("--profile="):] or True
+        elif arg in ["-f", "-j", "-t"]:
+            options[arg] = args and args.pop(0) or None
+        else:
+            options["paths"].append(arg)
+    if not options["paths"]:
+        abort("No filename")
+    return options
+
+
+if __name__ == "__main__":
+    opts = parse_options()
+    store = None
+    if "-c" in opts:
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools.cache import Cache
+        store = Cache()
+    dats = None
+    if "-d" in opts:
+        # pylint: disable-next=import-outside-toplevel
+        from sg_tools import dat
+        dats = dat.Index()
+    if "--profile" in opts:
+        instrument.option(opts["--profile"])
+    try:
+        if "-f" in opts or len(opts["paths"]) > 1 or os.path.isdir(opts["paths"][0]):
+            try:
+                workers = int(opts.get("-j", 0)) or None
+                seconds = float(opts.get("-t", 0)) or None
+            except ValueError:
+                abort("ERROR: Invalid options entered")
+            if opts.get("-f", "ndjson") not in ("ndjson", "csv"):
+                abort("ERROR: Invalid options entered")
+            # pylint: disable-next=import-outside-toplevel
+            from sg_tools import batch
+            status = batch.catalog(opts["paths"], opts.get("-f", "ndjson"), jobs=workers,
+                                   timeout=seconds, cache=store, index=dats)
+            raise SystemExit(status > 0)
+        try:
+            header = load(opts["paths"][0], cache=store)
+            header.metadata()
+        except decoder.ValidationError:
+            if dats is None:
+                raise
+            # The image may still be a headerless dump listed in a DAT
+            print("ERROR: %s" % sys.exc_info()[1])
+            header = None
+        if dats is not None:
+            timing = instrument.begin("identify")
+            try:
+                dat.display(dats.identify(opts["paths"][0]))
+            except (EnvironmentError, ValueError):
+                print("ERROR: %s" % sys.exc_info()[1])
+            instrument.end(timing)
+        raise SystemExit(header is None)
+    finally:
+        if store is not None:
+            store.close()
+        if dats is not None:
+            dats.close()
+        instrument.stop(sys.stderr)
@@ -0,0 +1,221 @@
+#!/usr/bin/python
+"""
+Opt-in instrumentation of the stages of reading headers and sending images.
+
+The library marks named stages, such as reading the header windows, scanning for a header, and
+waiting for the transfer ack. While a Profiler is started, the wall time of each stage and the
+peak memory allocated during it are recorded, reported to any callbacks, and summarized on
+stop. A cProfile dump of the whole run can be written as well. While none is started, marking a
+stage costs a function call.
+
+Stages are marked with begin() and end(), or the stage() context manager on Python 2.5+:
+
+    from sg_tools import header, instrument
+
+    profiler = instrument.start(callback=lambda name, seconds, peak: log(name, seconds))
+    with instrument.stage("library"):
+        for path in paths:
+            header.load(path, False)
+    instrument.stop()
+
+Only the stages of the thread that started the Profiler are recorded, so the stages of worker
+threads and processes, such as those of batch decoding or of sending to many Everdrives at once,
+are left out. Peak memory is traced with tracemalloc on Python 3.4+, and per stage on Python
+3.9+.
+"""
+
+import sys
+from time import time
+
+try:
+    from _thread import get_ident
+except ImportError:
+    from thread import get_ident
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Profiler started, or None
+ACTIVE = None
+
+
+class Profiler:
+    """
+    Recorder of the wall time and peak memory of stages.
+
+    Attributes:
+        records -- list
+    Name, seconds, and peak bytes allocated of every stage ended, in order.
+        callbacks -- list
+    Functions called with the name, seconds and peak bytes of every stage as it ends.
+        memory -- boolean
+    Whether memory is traced.
+        dump -- string
+    Path a cProfile dump is written to on stop, or None.
+        thread -- integer
+    Identifier of the thread whose stages are recorded.
+    """
+
+    def __init__(self, memory=True, dump=None, callback=None):
+        self.records = []
+        self.callbacks = []
+        if callback is not None:
+            self.callbacks.append(callback)
+        self.memory = memory and tracemalloc is not None
+        self.dump = dump
+        self.stack = []
+        self.tracing = False
+        self.cprofile = None
+        self.thread = get_ident()
+
+    def start(self):
+        """Start tracing memory, and profiling if a dump was asked for."""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        if self.dump:
+            # pylint: disable-next=import-outside-toplevel
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        """Stop tracing and profiling, ending any stages left open, and write the dump."""
+        if self.stack:
+            self.end(self.stack[0])
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.dump)
+            self.cprofile = None
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def peak(self):
+        """Record the peak memory traced so far in every open stage, and restart the peak."""
+        if not self.memory:
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        for entry in self.stack:
+            entry[3] = max(entry[3], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return current
+
+    def begin(self, name):
+        """Open a stage, returning its entry."""
+        current = self.peak()
+        entry = [name, time(), current, current]
+        self.stack.append(entry)
+        return entry
+
+    def end(self, entry):
+        """Close a stage, and any stage opened within it and left open."""
+        if entry not in self.stack:
+            return
+        now = time()
+        self.peak()
+        while self.stack:
+            name, began, current, peak = opened = self.stack.pop()
+            record = (name, now - began, peak - current)
+            self.records.append(record)
+            for callback in self.callbacks:
+                callback(*record)
+            if opened is entry:
+                break
+
+    def summary(self):
+        """Return the count, total seconds and largest peak of each stage name, in first order."""
+        names = []
+        totals = {}
+        for name, seconds, peak in self.records:
+            if name not in totals:
+                names.append(name)
+                totals[name] = [0, 0.0, 0]
+            totals[name][0] += 1
+            totals[name][1] += seconds
+            totals[name][2] = max(totals[name][2], peak)
+        return [(name, ) + tuple(totals[name]) for name in names]
+
+    def report(self, stream=None):
+        """Write a table of the summary of stages."""
+        stream = stream or sys.stderr
+        stream.write("%-20s %7s %12s %12s\n" % ("Stage", "Count", "Time (ms)", "Peak (kB)"))
+        for name, count, seconds, peak in self.summary():
+            stream.write("%-20s %7d %12.3f %12.1f\n" % (name, count, seconds * 1000,
+                                                        peak / 1024.0))
+        if self.dump:
+            stream.write("Profile written to %s\n" % self.dump)
+
+
+def start(dump=None, memory=True, callback=None):
+    """
+    Start recording stages, returning the Profiler.
+
+    Keywords:
+        dump -- path to write a cProfile dump to on stop, or None
+        memory -- whether to trace memory
+        callback -- function called with the name, seconds and peak bytes of every stage
+    """
+    # pylint: disable-next=global-statement
+    global ACTIVE
+    if ACTIVE is not None:
+        stop()
+    ACTIVE = Profiler(memory, dump, callback)
+    ACTIVE.start()
+    return ACTIVE
+
+
+def stop(stream=None):
+    """Stop recording stages, writing a report to a stream if given. Returns the Profiler."""
+    # pylint: disable-next=global-statement
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    if profiler is not None:
+        profiler.stop()
+        if stream is not None:
+            profiler.report(stream)
+    return profiler
+
+
+def begin(name):
+    """Open a stage, if recording. Returns a mark to pass to end()."""
+    if ACTIVE is None or ACTIVE.thread != get_ident():
+        return None
+    return ACTIVE.begin(name)
+
+
+def end(mark):
+    """Close the stage of a mark returned by begin()."""
+    if mark is not None and ACTIVE is not None:
+        ACTIVE.end(mark)
+
+
+class stage:  # pylint: disable=invalid-name
+    """Context manager marking a stage, for Python 2.5+."""
+
+    def __init__(self, name):
+        self.name = name
+        self.mark = None
+
+    def __enter__(self):
+        self.mark = begin(self.name)
+        return self.mark
+
+    def __exit__(self, *exc):
+        end(self.mark)
+        return False
+
+
+def option(value):
+    """
+    Start recording stages for a --profile command line option.
+
+    Keyword:
+        value -- True, or a path to write a cProfile dump to
+    """
+    if value is True:
+        return start()
+    return start(value)
@@ -0,0 +1,30 @@
+#!/usr/bin/python
+"""
+Recognition of images stored in zip and gzip archives, by their magic bytes.
+
+Kept apart from archive, which needs Python 2.7+, so that reading a plain image only costs a
+comparison of its first bytes, on any version. The archive module is only imported once these
+say a file is an archive.
+"""
+
+import struct
+
+ZIP = struct.pack("BBBB", 0x50, 0x4b, 0x03, 0x04)
+GZIP = struct.pack("BB", 0x1f, 0x8b)
+
+
+def compressed(magic):
+    """Return the archive type, zip or gzip, of a file starting with the bytes given, or None."""
+    if magic[:4] == ZIP:
+        return "zip"
+    if magic[:2] == GZIP:
+        return "gzip"
+    return None
+
+
+def detect(file):
+    """Return the archive type of an open file, or None, leaving it at its start."""
+    file.seek(0)
+    kind = compressed(file.read(4))
+    file.seek(0)
+    return kind
@@ -0,0 +1,78 @@
+"""Shared fixtures: the package on the path, and small synthetic images of every type."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "src"))
+
+# pylint: disable-next=wrong-import-position
+from sg_tools import bench, dump  # noqa: E402
+
+KB = bench.KB
+
+
+def interleave(image):
+    """Return a plain 16-bit image as an interleaved .smd image, with a blank copier header."""
+    half = dump.INTERLEAVE // 2
+    blocks = [bytes(dump.COPIER)]
+    for start in range(0, len(image), dump.INTERLEAVE):
+        block = image[start:start + dump.INTERLEAVE]
+        blocks.append(bytes(block[1::2]) + bytes(block[0::2]))
+        assert len(blocks[-1]) == 2 * half
+    return b"".join(blocks)
+
+
+def byteswap(image):
+    """Return a plain 16-bit image with the bytes of every word swapped."""
+    swapped = bytearray(len(image))
+    swapped[0::2] = image[1::2]
+    swapped[1::2] = image[0::2]
+    return bytes(swapped)
+
+
+def synthetic():
+    """Return a dict of names to synthetic images, one of every image type and header format."""
+    md = bytes(bench.synth_md(128 * KB))
+    return {"md.bin": md,
+            "32x.32x": bytes(bench.synth_md(256 * KB, b"SEGA 32X")),
+            "md.smd": interleave(md),
+            "swapped.bin": byteswap(md),
+            "eeprom.bin": bytes(bench.synth_md(128 * KB, extra=bench.EXTRAS["eeprom"])),
+            "7f.sms": bytes(bench.synth_sms(32 * KB)),
+            "81.sms": bytes(bench.synth_sms(64 * KB, 0x81f0)),
+            "3f.sms": bytes(bench.synth_sms(16 * KB, 0x3ff0, 0x4, 0xb)),
+            "1f.sms": bytes(bench.synth_sms(8 * KB, 0x1ff0, 0x4, 0xa)),
+            "sdsc.sms": bytes(bench.synth_sdsc(32 * KB)),
+            "game.sg": bytes(bench.synth_sg(32 * KB)),
+            "disc.iso": bytes(bench.synth_cd(64 * KB))}
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Write the synthetic images to a temporary directory, returning their paths by name."""
+    paths = {}
+    for name, image in synthetic().items():
+        path = tmp_path / name
+        path.write_bytes(image)
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.fixture
+def everdrive():
+    """Start an emulated Everdrive on a pseudo-terminal, stopping it afterwards."""
+    # pylint: disable-next=import-outside-toplevel
+    from sg_tools.emulator import Emulator
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def padded(image):
+    """Return an image padded with 0s to the Everdrive block size, as it is sent."""
+    # pylint: disable-next=import-outside-toplevel
+    from sg_tools.edsend import BLOCK
+    return bytes(image) + bytes(-len(image) % BLOCK)
@@ -0,0 +1,45 @@
+"""Tests of the asyncio loader against the emulated Everdrive."""
+
+import asyncio
+
+import pytest
+
+from conftest import padded, synthetic
+from sg_tools import aio
+from sg_tools.emulator import Emulator
+
+
+def load(path, port, **kwargs):
+    """Connect, send and run an image with an AsyncLoader, returning its error."""
+    async def steps():
+        loader = aio.AsyncLoader(path, port, **kwargs)
+        try:
+            error = await loader.init(10)
+            return error or await loader.start(30)
+        finally:
+            await loader.close()
+    return asyncio.run(steps())
+
+
+def test_send_and_run(everdrive, images):
+    sent = []
+    assert not load(images["md.smd"], everdrive.port, progress=lambda *counts: sent.append(counts))
+    assert everdrive.image == padded(synthetic()["md.bin"])
+    assert everdrive.runs == ["md"]
+    assert sent[-1][0] == len(everdrive.image)
+
+
+def test_missing_port_is_an_error(images, tmp_path, capsys):
+    assert load(images["md.bin"], str(tmp_path / "missing")) == 1
+    assert "Cannot find or open serial port" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("settings", [{"disconnect": 0x1000}, {"drop": "d"}],
+                         ids=["disconnect", "drop"])
+def test_failed_transfer_is_not_run(settings, images):
+    emulator = Emulator(**settings).start()
+    try:
+        assert load(images["md.bin"], emulator.port) == 1
+        assert emulator.runs == []
+    finally:
+        emulator.stop()
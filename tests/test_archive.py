@@ -0,0 +1,88 @@
+"""Tests of images read from zip and gzip archives, and of the plain path not needing them."""
+
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from sg_tools import checksum, edsend, header
+
+SOURCE = os.path.dirname(os.path.dirname(header.__file__))
+
+LEGACY = """
+import sys
+from sg_tools import header
+from sg_tools.edsend import Parser
+header.load(sys.argv[1])
+Parser(sys.argv[1])
+print("Loaded %s" % [name for name in ("sg_tools.archive", "zipfile", "gzip")
+                     if name in sys.modules])
+for path in sys.argv[2:]:
+    header.load(path)
+    print("Size %d" % len(Parser(path).data))
+"""
+
+
+def python2():
+    """Return the path of a Python 2 interpreter that runs, or None."""
+    path = os.environ.get("SG_TOOLS_PYTHON2") or shutil.which("python2.7")
+    if path and subprocess.call([path, "-c", "pass"], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL) == 0:
+        return path
+    return None
+
+
+# Python 2 interpreter to run the legacy import path under, if there is one
+PYTHON2 = python2()
+
+
+@pytest.fixture
+def archives(images, tmp_path):
+    """Write the plain image in a gzip and a zip archive, returning their paths by type."""
+    with open(images["md.bin"], "rb") as file:
+        image = file.read()
+    paths = {"gzip": str(tmp_path / "md.bin.gz"), "zip": str(tmp_path / "md.zip")}
+    with gzip.open(paths["gzip"], "wb") as file:
+        file.write(image)
+    with zipfile.ZipFile(paths["zip"], "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("readme.txt", "Not an image")
+        archive.writestr("game/md.bin", image)
+    return paths
+
+
+def test_plain_image_leaves_archive_unloaded(images):
+    output = subprocess.check_output([sys.executable, "-c", LEGACY, images["md.bin"]],
+                                     env=dict(os.environ, PYTHONPATH=SOURCE))
+    assert b"Loaded []" in output.splitlines()
+
+
+@pytest.mark.parametrize("kind", ["gzip", "zip"])
+def test_archive_reads_as_plain(kind, archives, images):
+    plain = header.load(images["md.bin"], False).record()
+    plain["path"] = archives[kind]
+    assert header.load(archives[kind], False).record() == plain
+    with open(images["md.bin"], "rb") as file:
+        assert bytes(edsend.Parser(archives[kind]).data) == file.read()
+    assert checksum.verify(archives[kind]) == checksum.verify(images["md.bin"])
+
+
+def test_truncated_archive_is_an_error(archives, tmp_path, capsys):
+    truncated = tmp_path / "truncated.gz"
+    with open(archives["gzip"], "rb") as file:
+        truncated.write_bytes(file.read()[:30])
+    assert header.load(str(truncated), False) is None
+    assert "Truncated or corrupt gzip archive" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not PYTHON2, reason="no Python 2 interpreter")
+def test_legacy_python(archives, images):
+    """Headers and images, plain or archived, are read on Python 2."""
+    output = subprocess.check_output([PYTHON2, "-c", LEGACY, images["md.bin"], archives["gzip"],
+                                      archives["zip"]], env=dict(os.environ, PYTHONPATH=SOURCE))
+    assert b"Loaded []" in output.splitlines()
+    sizes = [line for line in output.splitlines() if line.startswith(b"Size")]
+    assert sizes == [b"Size 131072", b"Size 131072"]
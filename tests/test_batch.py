@@ -0,0 +1,58 @@
+"""Tests of batch decoding, kept apart from the single header path."""
+
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+
+from sg_tools import batch, header
+
+SOURCE = os.path.dirname(os.path.dirname(header.__file__))
+
+
+def test_header_leaves_batch_mode_unloaded():
+    """Reading one header must not need the batch module or the process pool."""
+    script = ("import sys; from sg_tools import header; "
+              "print(sorted(set(['sg_tools.batch', 'concurrent.futures', 'multiprocessing'])"
+              " & set(sys.modules)))")
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     env=dict(os.environ, PYTHONPATH=SOURCE))
+    assert output.strip() == b"[]"
+
+
+def test_catalog_csv_every_format(images):
+    stream = io.StringIO()
+    failed = batch.catalog(sorted(images.values()), "csv", stream, jobs=1)
+    rows = dict([(os.path.basename(row["path"]), row)
+                 for row in csv.DictReader(io.StringIO(stream.getvalue()))])
+    assert failed == 0
+    assert sorted(rows) == sorted(images)
+    assert [row["error"] for row in rows.values()] == [""] * len(images)
+    assert rows["sdsc.sms"]["sdscversion"] == "1.02"
+    assert rows["sdsc.sms"]["sdscdate"] == "2007-12-25"
+    assert rows["game.sg"]["entry"] == "f3ed56c3"
+    assert rows["disc.iso"]["disc"] == "SEGADISCSYSTEM  "
+    assert rows["3f.sms"]["size"] == "16KB"
+    assert rows["md.smd"]["export"] == rows["md.bin"]["export"]
+
+
+def test_catalog_ndjson_reports_errors(images, tmp_path):
+    blank = tmp_path / "blank.bin"
+    blank.write_bytes(bytes(0x8000))
+    stream = io.StringIO()
+    failed = batch.catalog([images["md.bin"], str(blank)], "ndjson", stream, jobs=1)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert failed == 1
+    assert [record["error"] for record in records] == [None, "Invalid image header"]
+
+
+def test_pool_matches_serial(images, tmp_path):
+    paths = [str(tmp_path)]
+    serial = dict([(path, keys.record()) for path, keys, error in
+                   batch.iter_results(paths, jobs=1)])
+    pooled = dict([(path, keys.record()) for path, keys, error in
+                   batch.iter_results(paths, jobs=2, timeout=30)])
+    assert len(serial) == len(images)
+    assert pooled == serial
@@ -0,0 +1,144 @@
+"""Tests of the header cache, and of when its entries go stale."""
+
+import os
+import threading
+
+import pytest
+
+from conftest import synthetic
+from sg_tools import cache, header
+
+
+def retitle(path, title):
+    """Rewrite the export title of an image file in place, keeping its size."""
+    with open(path, "r+b") as file:
+        file.seek(0x150)
+        file.write(title.ljust(48).encode())
+
+
+def age(path, seconds=-100):
+    """Move the modification time of a file by the seconds given."""
+    info = os.stat(path)
+    os.utime(path, (info.st_atime, info.st_mtime + seconds))
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Return a cache in a temporary directory, closing it afterwards."""
+    result = cache.Cache(str(tmp_path / "cache" / "headers.sqlite"))
+    yield result
+    result.close()
+
+
+def cached(store, path):
+    """Load the header of an image through the cache, returning its export title."""
+    return header.load(path, False, cache=store).record()["export"].strip()
+
+
+def test_hit_is_not_decoded(store, images, monkeypatch):
+    assert store.get(images["md.bin"]) is None
+    assert cached(store, images["md.bin"]) == "SYNTHETIC IMAGE"
+    store.commit()
+
+    def undecoded(*args):
+        raise AssertionError("Decoded a cached header")
+    monkeypatch.setattr(header, "populate", undecoded)
+    hit = header.load(images["md.bin"], False, cache=store)
+    assert hit.record() == store.get(images["md.bin"]).record()
+    assert hit.path == images["md.bin"]
+
+
+def test_changed_image_is_stale(store, images):
+    cached(store, images["md.bin"])
+    retitle(images["md.bin"], "CHANGED")
+    age(images["md.bin"])
+    assert store.get(images["md.bin"]) is None
+    assert cached(store, images["md.bin"]) == "CHANGED"
+
+
+def test_touched_image_is_hashed(tmp_path, images):
+    for hashed, expected in ((False, None), (True, "SYNTHETIC IMAGE")):
+        store = cache.Cache(str(tmp_path / ("%s.sqlite" % hashed)), hashed=hashed)
+        cached(store, images["md.bin"])
+        age(images["md.bin"])
+        hit = store.get(images["md.bin"])
+        assert (hit and hit.record()["export"].strip()) == expected
+        store.close()
+
+
+def test_change_while_decoding_is_not_cached(store, images):
+    assert store.get(images["md.bin"]) is None
+    keys = header.load(images["md.bin"], False)
+    retitle(images["md.bin"], "CHANGED")
+    age(images["md.bin"])
+    store.put(images["md.bin"], keys)
+    assert store.get(images["md.bin"]) is None
+
+
+def test_cue_data_track_is_keyed(store, tmp_path):
+    track = tmp_path / "game.iso"
+    track.write_bytes(synthetic()["disc.iso"])
+    sheet = tmp_path / "game.cue"
+    sheet.write_text('FILE "game.iso" BINARY\n  TRACK 01 MODE1/2048\n    INDEX 01 00:00:00\n')
+    assert cached(store, str(sheet)) == "SYNTHETIC IMAGE"
+    assert store.get(str(sheet)) is not None
+    retitle(str(track), "REPLACED")
+    age(str(track), 100)
+    assert store.get(str(sheet)) is None
+    assert cached(store, str(sheet)) == "REPLACED"
+
+
+def test_persists_and_prunes(tmp_path, images):
+    path = str(tmp_path / "headers.sqlite")
+    store = cache.Cache(path)
+    for name in ("md.bin", "7f.sms"):
+        header.load(images[name], False, cache=store)
+    store.close()
+    store = cache.Cache(path)
+    assert store.usage()[0] == 2
+    assert store.get(images["7f.sms"]).mode == "sms"
+    os.remove(images["md.bin"])
+    assert store.prune() == 1
+    store.invalidate(images["7f.sms"])
+    assert store.usage() == (0, 0)
+    store.close()
+
+
+def test_version_change_drops_entries(tmp_path, images, monkeypatch):
+    path = str(tmp_path / "headers.sqlite")
+    store = cache.Cache(path)
+    header.load(images["md.bin"], False, cache=store)
+    store.close()
+    monkeypatch.setattr(cache, "VERSION", cache.VERSION + 1)
+    store = cache.Cache(path)
+    assert store.usage()[0] == 0
+    store.close()
+
+
+def test_least_recently_used_evicted(store, images):
+    for name in ("md.bin", "7f.sms", "game.sg"):
+        header.load(images[name], False, cache=store)
+        store.commit()
+    store.get(images["md.bin"])
+    store.limit = store.usage()[1] - 1
+    store.commit()
+    assert store.get(images["7f.sms"]) is None
+    assert store.get(images["md.bin"]) is not None
+
+
+def test_shared_between_threads(store, images):
+    errors = []
+
+    def load(name):
+        try:
+            header.load(images[name], False, cache=store)
+        # pylint: disable-next=broad-except
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=load, args=(name, )) for name in sorted(images)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.usage()[0] == len(images)
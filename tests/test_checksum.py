@@ -0,0 +1,57 @@
+"""Tests of checksum verification."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sg_tools import checksum
+from sg_tools.decoder import ValidationError
+
+SOURCE = os.path.dirname(os.path.dirname(checksum.__file__))
+
+
+def plain_wordsum(image):
+    """Return the 16-bit word sum from 0x200, computed one word at a time."""
+    total = 0
+    for offset in range(0x200, len(image) - 1, 2):
+        total += (image[offset] << 8) | image[offset + 1]
+    return total & 0xffff
+
+
+def test_import_leaves_numpy_unloaded():
+    script = "import sys; import sg_tools.checksum; print('numpy' in sys.modules)"
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     env=dict(os.environ, PYTHONPATH=SOURCE))
+    assert output.strip() == b"False"
+
+
+def test_layouts_agree(images):
+    with open(images["md.bin"], "rb") as file:
+        expected = plain_wordsum(bytearray(file.read()))
+    reports = [checksum.verify(images[name]) for name in ("md.bin", "md.smd", "swapped.bin")]
+    assert [report["computed"] for report in reports] == [expected] * 3
+    assert reports[0]["consistent"] and reports[0]["mode"] == "md"
+
+
+def test_sms(images):
+    report = checksum.verify(images["7f.sms"])
+    assert report["mode"] == "sms"
+    assert report["computed"] == report["stored"] == 0
+    assert report["match"] and report["consistent"]
+
+
+@pytest.mark.parametrize("image", [b"\x00" * 0x100 + b"SEGA MEGA DRIVE ",
+                                   b"\x00" * 0x7ff0 + b"TMR SEGA"], ids=["md", "sms"])
+def test_short_image_is_invalid(tmp_path, image):
+    path = tmp_path / "short.bin"
+    path.write_bytes(image)
+    with pytest.raises(ValidationError):
+        checksum.verify(str(path))
+    run = subprocess.run([sys.executable, "-m", "sg_tools.checksum", str(path)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         env=dict(os.environ, PYTHONPATH=SOURCE), check=False)
+    assert run.returncode == 1
+    assert b"ERROR: Invalid image header" in run.stdout
+    assert not run.stderr
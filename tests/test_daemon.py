@@ -0,0 +1,74 @@
+"""Tests of the edsend daemon, over its Unix socket and TCP, against the emulator."""
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from conftest import padded, synthetic
+from sg_tools import daemon
+
+
+def free_port():
+    """Return a TCP port free on localhost."""
+    probe = socket.socket()
+    probe.bind((daemon.LOCALHOST, 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+@pytest.fixture
+def served(everdrive, tmp_path):
+    """Serve a daemon connected to the emulator, returning its Unix socket and TCP address."""
+    path = str(tmp_path / "daemon.sock")
+    tcp = (daemon.LOCALHOST, free_port())
+    owner = daemon.Daemon(everdrive.port, (9600, 1, ))
+    thread = threading.Thread(target=owner.serve, args=(path, tcp, "secret"))
+    thread.daemon = True
+    thread.start()
+    deadline = time.time() + 10
+    while not (os.path.exists(path) and len(owner.servers) == 2) and time.time() < deadline:
+        time.sleep(0.02)
+    yield path, tcp
+    daemon.request({"command": "stop"}, path)
+    thread.join(10)
+
+
+def stream(path, tcp, token="secret", mode="md"):
+    """Stream an image file to the daemon over TCP, returning its reply."""
+    with open(path, "rb") as file:
+        payload = file.read()
+    message = {"command": "stream", "mode": mode, "size": len(payload),
+               "sha1": daemon.digest(payload), "name": os.path.basename(path), "token": token}
+    return daemon.request(message, tcp=tcp, payload=payload)
+
+
+def test_send_and_stream_share_hashes(everdrive, served, images):
+    path, tcp = served
+    plain = padded(synthetic()["md.bin"])
+    answer = daemon.request({"command": "send", "mode": "md", "path": images["md.smd"]}, path)
+    assert answer == {"ok": True, "cached": False}
+    assert everdrive.image == plain
+    # The same file streamed is already loaded, so it is only run again
+    assert stream(images["md.smd"], tcp) == {"ok": True, "cached": True}
+    assert stream(images["swapped.bin"], tcp) == {"ok": True, "cached": False}
+    assert everdrive.image == plain
+    assert everdrive.runs == ["md", "md", "md"]
+
+
+def test_tcp_is_guarded(everdrive, served, images):
+    path, tcp = served
+    answer = stream(images["md.bin"], tcp, token="wrong")
+    assert answer == {"ok": False, "error": "Invalid token"}
+    answer = daemon.request({"command": "send", "path": images["md.bin"], "token": "secret"},
+                            tcp=tcp)
+    assert not answer["ok"] and "not taken over TCP" in answer["error"]
+    assert everdrive.runs == []
+
+
+def test_remote_host_requires_token():
+    with pytest.raises(ValueError):
+        daemon.Daemon("/dev/null").serve("/nonexistent", ("0.0.0.0", 0), None)
@@ -0,0 +1,110 @@
+"""Tests of the DAT index: parsing DATs, and identifying images against them."""
+
+import binascii
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from conftest import synthetic
+from sg_tools import dat
+
+ENTRY = '<game name="%s"><rom name="%s" size="%d" crc="%08x"%s/></game>\n'
+
+
+def entry(game, name, image, sha1=True):
+    """Return the XML of a game with one dump of an image, with or without its SHA-1."""
+    digest = ""
+    if sha1 is True:
+        digest = ' sha1="%s"' % hashlib.sha1(image).hexdigest()
+    elif sha1:
+        digest = ' sha1="%s"' % sha1
+    return ENTRY % (game, name, len(image), zlib.crc32(image) & 0xffffffff, digest)
+
+
+def write(path, name, games):
+    """Write a Logiqx DAT file of the games given."""
+    path.write_text('<?xml version="1.0"?>\n<datafile><header><name>%s</name></header>\n%s'
+                    '</datafile>\n' % (name, "".join(games)))
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Return an index of a DAT listing synthetic images, with and without SHA-1 digests."""
+    images = synthetic()
+    games = [entry("Synthetic (Rev A)", "md.bin", images["md.bin"]),
+             entry("Synthetic SG", "game.sg", images["game.sg"], sha1=False),
+             entry("Bad SHA-1", "7f.sms", images["7f.sms"], sha1="00" * 20)]
+    result = dat.Index(str(tmp_path / "index" / "dats.sqlite"))
+    result.add(write(tmp_path / "test.dat", "Test - Synthetic", games))
+    yield result
+    result.close()
+
+
+def test_parse(tmp_path):
+    image = synthetic()["md.bin"]
+    path = write(tmp_path / "test.dat", "Test", [entry("Demo (Rev 1)", "demo.bin", image),
+                                                 entry("Demo", "demo.bin", image, sha1=False)])
+    name, dumps = dat.parse(path)
+    assert name == "Test"
+    assert [tuple(row[:5]) for row in dumps] == [
+        ("Demo (Rev 1)", "1", "demo.bin", len(image), zlib.crc32(image) & 0xffffffff),
+        ("Demo", None, "demo.bin", len(image), zlib.crc32(image) & 0xffffffff)]
+    assert bytes(dumps[0][5]) == hashlib.sha1(image).digest()
+    assert dumps[1][5] is None
+
+
+def test_parse_rejects_invalid_xml(tmp_path):
+    path = tmp_path / "bad.dat"
+    path.write_text("<datafile><game>")
+    with pytest.raises(SyntaxError):
+        dat.parse(str(path))
+
+
+@pytest.mark.parametrize("name", ["md.bin", "md.smd", "swapped.bin"])
+def test_identify_every_layout(name, index, images):
+    match = index.identify(images[name])
+    assert match["dat"] == "Test - Synthetic"
+    assert (match["title"], match["revision"], match["name"]) == ("Synthetic (Rev A)", "A",
+                                                                  "md.bin")
+    assert match["sha1"] == hashlib.sha1(synthetic()["md.bin"]).hexdigest()
+
+
+def test_identify_by_crc_without_sha1(index, images):
+    assert index.identify(images["game.sg"])["sha1"] is None
+
+
+def test_sha1_mismatch_is_unknown(index, images):
+    assert index.identify(images["7f.sms"]) is None
+
+
+def test_unlisted_size_is_not_read(index, images, monkeypatch):
+    def unread(data):
+        raise AssertionError("Hashed an image of a size no dump has")
+    monkeypatch.setattr(dat, "hashes", unread)
+    assert index.identify(images["3f.sms"]) is None
+
+
+def test_readd_only_when_changed(index, tmp_path, images):
+    path = str(tmp_path / "test.dat")
+    assert index.add(path) == 0
+    write(tmp_path / "test.dat", "Test - Synthetic", [entry("Other", "md.bin",
+                                                            synthetic()["md.bin"])])
+    info = os.stat(path)
+    os.utime(path, (info.st_atime, info.st_mtime + 10))
+    assert index.add(path) == 1
+    assert index.identify(images["md.bin"])["title"] == "Other"
+    assert index.identify(images["game.sg"]) is None
+    index.remove(path)
+    assert index.sizes == set()
+    assert index.usage() == []
+
+
+def test_hashes_in_steps(monkeypatch):
+    monkeypatch.setattr(dat, "STEP", 1000)
+    image = synthetic()["md.bin"]
+    crc, sha1 = dat.hashes(bytearray(image))
+    assert crc == zlib.crc32(image) & 0xffffffff
+    assert binascii.hexlify(sha1) == hashlib.sha1(image).hexdigest().encode()
@@ -0,0 +1,64 @@
+"""Tests of the decoder backends and the signature scan."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sg_tools import decoder, header
+
+SOURCE = os.path.dirname(os.path.dirname(decoder.__file__))
+# Decode every image, and address ranges of every length, printing the results as JSON
+SCRIPT = """
+import json, sys
+from sg_tools import decoder, header
+results = {"backend": decoder.BACKEND}
+for path in sys.argv[1:]:
+    results[path] = header.load(path, False).record()
+for length in range(9):
+    try:
+        results["alloc%d" % length] = decoder.alloc(decoder.view(bytes(range(1, 9)))[:length])
+    except ValueError:
+        results["alloc%d" % length] = "ValueError"
+print(json.dumps(results, sort_keys=True))
+"""
+
+
+def decode_with(backend, paths):
+    """Return the results of SCRIPT run with a decoder backend."""
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT] + paths,
+                                     env=dict(os.environ, PYTHONPATH=SOURCE,
+                                              SG_TOOLS_DECODER=backend))
+    return json.loads(output.decode())
+
+
+def test_backends_agree(images):
+    paths = sorted(images.values())
+    tuples = decode_with("tuple", paths)
+    native = decode_with("bytes", paths)
+    assert (tuples.pop("backend"), native.pop("backend")) == ("tuple", "bytes")
+    assert native == tuples
+    assert native["alloc4"] == "ValueError"
+
+
+def test_eeprom_range_is_decoded(images):
+    keys = header.load(images["eeprom.bin"], False)
+    assert keys.get("extra")[:2] == ("EEPROM", "Unknown")
+    assert keys.get("extra")[2][0] == "00200001"
+
+
+@pytest.mark.parametrize("name, mode, section", [
+    ("md.bin", "md", None), ("32x.32x", "md", None), ("7f.sms", "sms", "7f"),
+    ("81.sms", "sms", "81"), ("3f.sms", "sms", "3f"), ("1f.sms", "sms", "1f"),
+    ("sdsc.sms", "sms", "sdsc"), ("game.sg", "sg", None), ("disc.iso", "cd", None)])
+def test_scan(images, name, mode, section):
+    with open(images[name], "rb") as file:
+        data = decoder.view(file.read(header.WINDOW))
+    assert decoder.scan(data) == (mode, section)
+
+
+def test_scan_rejects_blank():
+    with pytest.raises(decoder.ValidationError):
+        decoder.scan(decoder.view(bytes(header.WINDOW)))
@@ -0,0 +1,92 @@
+"""Tests of locating disc headers in ISO and raw BIN images, and through CUE sheets."""
+
+import os
+
+import pytest
+
+from conftest import synthetic
+from sg_tools import disc, header
+
+SYNC = b"\x00" + b"\xff" * 10 + b"\x00"
+
+
+def raw(iso, mode):
+    """Return an ISO image as a raw BIN image of 2352-byte sectors, in mode 1 or 2."""
+    user = disc.USER["MODE%d/2352" % mode]
+    sectors = []
+    for start in range(0, len(iso), 2048):
+        head = SYNC + b"\x00\x02\x00" + bytes([mode]) + b"\x00" * (user - 16)
+        sectors.append((head + iso[start:start + 2048]).ljust(2352, b"\x00"))
+    return b"".join(sectors)
+
+
+def cue(path, lines, encoding="ascii"):
+    """Write a CUE sheet of the lines given, with CRLF line ends."""
+    path.write_bytes("\r\n".join(lines).encode(encoding) + b"\r\n")
+    return str(path)
+
+
+@pytest.fixture
+def iso():
+    """Return a synthetic disc image, as an ISO."""
+    return synthetic()["disc.iso"]
+
+
+@pytest.mark.parametrize("mode", [1, 2])
+def test_raw_sectors(mode, iso, tmp_path):
+    path = tmp_path / "game.bin"
+    path.write_bytes(raw(iso, mode))
+    assert disc.read(str(path)) == iso[:disc.HEADER]
+    assert disc.locate(raw(iso, mode)) == disc.USER["MODE%d/2352" % mode]
+
+
+def test_iso(iso, tmp_path):
+    path = tmp_path / "game.iso"
+    path.write_bytes(iso)
+    assert disc.read(str(path)) == iso[:disc.HEADER]
+
+
+def test_not_a_disc(tmp_path):
+    path = tmp_path / "game.bin"
+    path.write_bytes(synthetic()["md.bin"])
+    with pytest.raises(IOError):
+        disc.read(str(path))
+
+
+def test_cue_first_data_track(iso, tmp_path):
+    """The data track is found after audio tracks, at its index in a file shared with them."""
+    audio = b"\x00" * 2352 * 150
+    (tmp_path / "game.bin").write_bytes(audio + raw(iso, 1))
+    path = cue(tmp_path / "game.cue",
+               ['FILE "game.bin" BINARY', "  TRACK 01 AUDIO", "    INDEX 00 00:00:00",
+                "  TRACK 02 MODE1/2352", "    INDEX 00 00:01:00", "    INDEX 01 00:02:00"])
+    assert disc.track(path) == (str(tmp_path / "game.bin"), 2352 * 150 + 16)
+    assert disc.read(path) == iso[:disc.HEADER]
+
+
+def test_cue_unquoted_file(iso, tmp_path):
+    (tmp_path / "game.iso").write_bytes(iso)
+    path = cue(tmp_path / "game.cue", ["file game.iso binary", "track 01 mode1/2048",
+                                       "index 01 00:00:00"])
+    assert disc.read(path) == iso[:disc.HEADER]
+
+
+def test_cue_without_data_track(tmp_path):
+    path = cue(tmp_path / "audio.cue", ['FILE "audio.bin" BINARY', "  TRACK 01 AUDIO",
+                                        "    INDEX 01 00:00:00"])
+    with pytest.raises(IOError):
+        disc.track(path)
+
+
+@pytest.mark.parametrize("encoding", ["cp932", "latin-1"])
+def test_cue_in_any_encoding(encoding, iso, tmp_path):
+    """CUE sheets written in a local encoding are read, and their file names taken as bytes."""
+    name = "ゲーム.iso" if encoding == "cp932" else "g\xe9me.iso"
+    data = name.encode(encoding)
+    with open(os.path.join(os.fsencode(str(tmp_path)), data), "wb") as file:
+        file.write(iso)
+    path = cue(tmp_path / "game.cue", ['REM COMMENT "%s"' % name, 'FILE "%s" BINARY' % name,
+                                       "  TRACK 01 MODE1/2048", "    INDEX 01 00:00:00"], encoding)
+    assert os.fsencode(disc.track(path)[0]) == os.path.join(os.fsencode(str(tmp_path)), data)
+    keys = header.load(path, False)
+    assert keys is not None and keys.mode == "cd"
@@ -0,0 +1,59 @@
+"""Tests of detecting and converting interleaved and byte-swapped dumps."""
+
+import pytest
+
+from conftest import KB, byteswap, interleave, synthetic
+from sg_tools import bench, dump
+
+LAYOUTS = {"md.bin": None, "32x.32x": None, "md.smd": "smd", "swapped.bin": "swapped",
+           "7f.sms": None}
+
+
+@pytest.fixture(params=["numpy", "slices"])
+def converter(request, monkeypatch):
+    """Convert with NumPy, or with slice assignment only."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(dump, "NUMPY", None)
+    else:
+        monkeypatch.setattr(dump, "NUMPY", False)
+    return request.param
+
+
+@pytest.mark.parametrize("name", sorted(LAYOUTS))
+def test_detect(name):
+    image = synthetic()[name]
+    assert dump.detect(image) == LAYOUTS[name]
+    assert dump.detect(memoryview(image)) == LAYOUTS[name]
+
+
+def test_smd_needs_whole_first_block():
+    image = synthetic()["md.smd"]
+    assert dump.detect(image[:dump.COPIER + dump.INTERLEAVE - 1]) is None
+
+
+def test_plain_is_not_copied():
+    image = synthetic()["md.bin"]
+    assert dump.normalize(image) == (image, None)
+
+
+@pytest.mark.parametrize("size", [128 * KB, 1024 * KB])
+def test_normalize(size, converter):
+    image = bytes(bench.synth_md(size))
+    assert dump.normalize(interleave(image)) == (bytearray(image), "smd")
+    assert dump.normalize(byteswap(image)) == (bytearray(image), "swapped")
+
+
+def test_partial_block_and_odd_byte(converter):
+    image = bytes(bench.synth_md(1024 * KB))
+    plain, layout = dump.normalize(interleave(image) + b"\xff" * 100)
+    assert (plain, layout) == (bytearray(image), "smd")
+    plain, layout = dump.normalize(byteswap(image) + b"\xff")
+    assert (plain, layout) == (bytearray(image + b"\xff"), "swapped")
+
+
+def test_window_converts_first_block():
+    image = synthetic()["md.bin"]
+    plain, layout = dump.window(interleave(image))
+    assert layout == "smd"
+    assert plain == bytearray(image[:dump.INTERLEAVE])
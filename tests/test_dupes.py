@@ -0,0 +1,60 @@
+"""Tests of the duplicate and overdump finder, stage by stage."""
+
+import hashlib
+
+from conftest import KB, byteswap, synthetic
+from sg_tools import bench, dupes
+
+
+def changed(image, offset):
+    """Return a copy of an image with the byte at an offset changed."""
+    copy = bytearray(image)
+    copy[offset] ^= 0xff
+    return bytes(copy)
+
+
+def test_duplicates_stage_by_stage(tmp_path):
+    large = bytes(bench.synth_md(256 * KB))
+    files = {"a.bin": large, "b.bin": large, "c.bin": large,
+             "end.bin": changed(large, len(large) - 1),  # dropped by the ends
+             "middle.bin": changed(large, 128 * KB),  # only told apart by the full hash
+             "checksum.bin": changed(large, 0x18f),  # dropped by the header
+             "swapped.bin": byteswap(large),  # the same header, dropped by the ends
+             "small.bin": synthetic()["md.bin"],  # dropped by the size
+             "empty.bin": b""}
+    for name, image in files.items():
+        (tmp_path / name).write_bytes(image)
+    stats = {}
+    groups = dupes.duplicates([str(tmp_path)], 1, stats)
+    assert groups == [(hashlib.sha1(large).hexdigest(), len(large),
+                       [str(tmp_path / name) for name in ("a.bin", "b.bin", "c.bin")])]
+    assert stats == {"files": 8, "size": 7, "header": 6, "ends": 4, "hashed": 4}
+
+
+def test_pool_matches_serial(tmp_path):
+    image = synthetic()["md.bin"]
+    for name in ("a.bin", "b.bin", "c.sms"):
+        (tmp_path / name).write_bytes(image)
+    assert dupes.duplicates([str(tmp_path)], 2) == dupes.duplicates([str(tmp_path)], 1)
+
+
+def test_overdumps(tmp_path):
+    image = synthetic()["7f.sms"]
+    files = {"two.sms": image * 2, "four.sms": image * 4,
+             "late.sms": image + changed(image, len(image) - 1),  # halves start the same
+             "plain.sms": image, "tiny.sms": image[:0x1000] * 2}
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+    found = sorted(dupes.overdumps([str(tmp_path)], 1))
+    assert found == [(str(tmp_path / "four.sms"), 4, len(image)),
+                     (str(tmp_path / "two.sms"), 2, len(image))]
+
+
+def test_mirrored_in_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr(dupes, "STEP", 1000)
+    image = synthetic()["md.bin"]
+    path = tmp_path / "over.bin"
+    path.write_bytes(image * 4)
+    assert dupes.mirrored(str(path)) == 4
+    path.write_bytes(image * 2 + changed(image * 2, len(image) + 5))
+    assert dupes.mirrored(str(path)) == 1
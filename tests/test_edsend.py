@@ -0,0 +1,70 @@
+"""Tests of sending images to the emulated Everdrive, found by scanning or given by port."""
+
+import os
+
+import pytest
+
+from conftest import padded, synthetic
+from sg_tools import edsend
+from sg_tools.emulator import Emulator
+
+# Bytes per second, slower than a block is written within the probe timeout
+BANDWIDTH = 60000
+
+
+@pytest.fixture
+def throttled(monkeypatch, tmp_path):
+    """Start two emulated Everdrives capped in bandwidth, as the only ports found by a scan."""
+    monkeypatch.setenv("SG_TOOLS_CACHE", str(tmp_path / "cache" / "headers.sqlite"))
+    emulators = [Emulator(bandwidth=BANDWIDTH).start() for index in range(2)]
+    monkeypatch.setattr(edsend, "candidates", lambda: [emulator.port for emulator in emulators])
+    yield emulators
+    for emulator in emulators:
+        emulator.stop()
+
+
+def test_loader_sends_to_port(everdrive, images):
+    loader = edsend.Loader(images["md.smd"], everdrive.port, mode="md")
+    loader.init()
+    loader.start()
+    loader.link.cxn.close()
+    assert not loader.error
+    assert everdrive.image == padded(synthetic()["md.bin"])
+    assert everdrive.runs == ["md"]
+
+
+def test_scanned_port_keeps_write_timeout(throttled, images):
+    """A port found by a scan sends with the full write timeout, not the probe timeout."""
+    loader = edsend.Loader(images["md.bin"], None, mode="md")
+    assert loader.serial_port == throttled[0].port
+    loader.init()
+    loader.start()
+    loader.link.cxn.close()
+    assert not loader.error
+    assert throttled[0].image == padded(synthetic()["md.bin"])
+    assert edsend.recall() == throttled[0].port
+
+
+def test_fanout_to_scanned_ports(throttled, images):
+    reports = edsend.fanout(images["md.bin"], mode="md")
+    assert [report["port"] for report in reports] == [emulator.port for emulator in throttled]
+    assert [report["error"] for report in reports] == [None, None]
+    for emulator in throttled:
+        assert emulator.image == padded(synthetic()["md.bin"])
+        assert emulator.runs == ["md"]
+
+
+def test_fanout_reports_failed_port(everdrive, images, tmp_path):
+    missing = str(tmp_path / "missing")
+    reports = edsend.fanout(images["md.bin"], [everdrive.port, missing], mode="md")
+    assert reports[0]["error"] is None
+    assert reports[1]["error"].startswith("connect failed")
+    assert everdrive.runs == ["md"]
+
+
+def test_missing_port_is_an_error(images, tmp_path, capsys):
+    loader = edsend.Loader(images["md.bin"], str(tmp_path / "missing"), mode="md")
+    loader.init()
+    loader.start()
+    assert loader.error == 1
+    assert "Cannot find or open serial port" in capsys.readouterr().out